@@ -0,0 +1,164 @@
+import hashlib
+import importlib
+import json
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import streamlit as st
+
+from configuracion import secreto
+
+# Este módulo es lo único que necesita la pantalla de login: no importa
+# pandas, gspread ni las vistas. Esos se cargan en el hilo de arranque
+# mientras el H:. escribe su usuario y contraseña.
+
+# ==========================================
+# 1. CONTRASEÑAS Y LOGIAS
+# ==========================================
+# ⚠️ ASEGÚRATE DE QUE ESTE NOMBRE SEA EL CORRECTO
+LIBRO_DEFAULT = "Sec y Tes"
+
+
+def make_hash(password):
+    return hashlib.sha256(str.encode(password)).hexdigest()
+
+
+def check_hashes(password, hashed_text):
+    return make_hash(password) == hashed_text
+
+
+def logias():
+    # Varias logias en un solo despliegue: sección `[logias]` en secrets con
+    # nombre visible -> libro (título en Drive; con almacen = "memoria", la
+    # ruta del JSON). Sin ella, una sola logia con el libro de siempre.
+    conf = secreto("logias")
+    return dict(conf) if conf else {LIBRO_DEFAULT: None}
+
+
+# ==========================================
+# 2. CONEXIÓN EN SEGUNDO PLANO
+# ==========================================
+# Al pintar el login se pide el libro de la logia elegida: un hilo autoriza
+# la cuenta de servicio, abre el libro y de paso importa los módulos de las
+# vistas. Al dar "Entrar" normalmente ya está listo. Un libro por logia,
+# compartido por todas las sesiones; si la apertura falla, el siguiente
+# intento vuelve a conectar en lugar de quedarse con el error.
+MODULOS_VISTAS = ["datos", "calculos", "saldos", "caja", "estados", "folios"]  # cierre (pyarrow) solo en Mantenimiento
+
+
+class Conexiones:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._lock_cliente = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="arranque")
+        self._cliente = None
+        self._libros = {}  # logia -> Future del libro
+
+    def iniciar(self, logia):
+        # No espera: regresa el Future del libro
+        with self._lock:
+            fut = self._libros.get(logia)
+            if fut is None or (fut.done() and fut.exception() is not None):
+                try:
+                    fut = self._pool.submit(self._abrir, logia, _configuracion(logia))
+                except Exception as e:
+                    # Secrets incompletos: el login se pinta igual y el error
+                    # sale al dar "Entrar" (connect_db lo relanza)
+                    fut = Future()
+                    fut.set_exception(e)
+                self._libros[logia] = fut
+            return fut
+
+    def libro(self, logia):
+        return self.iniciar(logia).result()
+
+    def _autorizar(self, cuenta):
+        # Un solo cliente autorizado (y su sesión HTTP) para todas las logias
+        with self._lock_cliente:
+            if self._cliente is None:
+                import gspread
+                from google.oauth2.service_account import Credentials
+                scope = ['https://www.googleapis.com/auth/spreadsheets', "https://www.googleapis.com/auth/drive"]
+                creds = Credentials.from_service_account_info(cuenta, scopes=scope)
+                self._cliente = gspread.authorize(creds)
+            return self._cliente
+
+    def _abrir(self, logia, conf):
+        from metricas import LibroMedido
+        # Libro de pruebas sin Google (ver almacen.py y bench.py): almacen = "memoria"
+        if conf["memoria"]:
+            from almacen import LibroMemoria
+            sh = LibroMedido(LibroMemoria.abrir(conf["libro"], conf["latencia"]), logia)
+        else:
+            sh = LibroMedido(self._autorizar(conf["cuenta"]).open(conf["libro"]), logia)  # cada llamada queda en metricas.py
+        for modulo in MODULOS_VISTAS:
+            importlib.import_module(modulo)
+        return sh
+
+
+def _configuracion(logia):
+    # Se lee en el hilo del script: el de arranque no toca st.secrets
+    libro = logias().get(logia)
+    if secreto("almacen", "sheets") == "memoria":
+        return {"memoria": True, "libro": libro or secreto("almacen_ruta"),
+                "latencia": secreto("almacen_latencia_ms", 0, float) / 1000}
+    return {"memoria": False, "libro": libro or LIBRO_DEFAULT, "cuenta": st.secrets["gcp_service_account"]}
+
+
+@st.cache_resource
+def _conexiones():
+    return Conexiones()
+
+
+def iniciar_conexion(logia=LIBRO_DEFAULT):
+    _conexiones().iniciar(logia)
+
+
+def connect_db(logia=LIBRO_DEFAULT):
+    # Cachés, índices y espejo van por sh.id (datos.py)
+    return _conexiones().libro(logia)
+
+
+# ==========================================
+# 3. COPIA LOCAL DE CREDENCIALES (OPCIONAL)
+# ==========================================
+# Con `credenciales_locales = "ruta.json"` en secrets, cada vez que datos.py
+# reconstruye el índice de usuarios se guarda aquí (usuario -> hash, rol,
+# ID_H, nombre y grado, por logia). El login valida contra esta copia sin
+# esperar a Sheets; la sesión se confirma contra DIRECTORIO en el primer
+# rerun ya dentro. Si el usuario no está o la contraseña no coincide, se
+# consulta DIRECTORIO directamente (pudo cambiar después de la copia).
+@st.cache_resource
+def _candado_credenciales():
+    return threading.Lock()
+
+
+def _leer_credenciales(ruta):
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def guardar_credenciales(logia, usuarios):
+    # `usuarios` ya en tipos de JSON: usuario -> {Password, Rol, ID_H, ...}
+    ruta = secreto("credenciales_locales")
+    if not ruta or not logia:
+        return
+    with _candado_credenciales():
+        copia = _leer_credenciales(ruta)
+        copia[logia] = usuarios
+        temporal = f"{ruta}.tmp"
+        # Solo legible por el proceso: lleva los hashes de las contraseñas
+        with os.fdopen(os.open(temporal, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w", encoding="utf-8") as f:
+            json.dump(copia, f, ensure_ascii=False)
+        os.replace(temporal, ruta)
+
+
+def credencial_guardada(logia, usuario):
+    ruta = secreto("credenciales_locales")
+    if not ruta:
+        return None
+    return _leer_credenciales(ruta).get(logia, {}).get(usuario)
@@ -0,0 +1,256 @@
+import json
+import os
+import threading
+import time
+from typing import Protocol
+
+from gspread.exceptions import WorksheetNotFound
+from gspread.utils import a1_range_to_grid_range, rowcol_to_a1
+
+# ==========================================
+# 1. INTERFAZ DE ALMACENAMIENTO
+# ==========================================
+# Lo que la app usa del libro (datos.py, saldos.py y cierre.py). Un
+# gspread.Spreadsheet ya la cumple tal cual; LibroMemoria es la otra
+# implementación, para probar y medir sin cuenta de Google.
+class Hoja(Protocol):
+    id: int
+    title: str
+
+    def row_values(self, fila): ...
+
+    def get(self, rango): ...
+
+    def update(self, range_name=None, values=None): ...
+
+    def append_row(self, values, value_input_option=None, table_range=None): ...
+
+
+class Libro(Protocol):
+    id: str
+
+    def worksheets(self): ...
+
+    def worksheet(self, titulo): ...
+
+    def add_worksheet(self, title, rows, cols): ...
+
+    def values_batch_get(self, ranges, params=None): ...
+
+    def batch_update(self, body): ...
+
+
+# Encabezados de un libro nuevo (mismo orden que escriben las vistas)
+ENCABEZADOS = {
+    "DIRECTORIO": [
+        "ID_H", "Nombre_Completo", "Usuario", "Password", "Reset_Requerido", "Rol", "Grado_Actual", "Estatus",
+        "Fecha_Nac", "Tel_Fijo", "Tel_Celular", "Email", "Direccion",
+        "Fecha_Inic", "Fecha_Aum", "Fecha_Exal",
+        "Profesion", "Lugar_Trabajo", "Puesto", "Horario_Trabajo", "Tel_Trabajo",
+        "Tipo_Sangre", "Enf_Cronicas", "Alergias", "Seguro_Medico", "Vulnerable_Covid",
+        "Contacto_Emergencia", "Tel_Emergencia", "Parentesco_Emergencia",
+        "Beneficiario", "Tel_Beneficiario", "Parentesco_Beneficiario",
+        "Historial_Cargos",
+    ],
+    "TESORERIA": ["Fecha", "ID_H", "Concepto", "Tipo", "Monto"],
+    "ASISTENCIAS": ["Fecha_Tenida", "Grado", "ID_H", "Estado", "Observaciones"],
+    "LIBRO_CAJA": ["Fecha", "Concepto", "Categoria", "Entrada", "Salida", "Comprobante"],
+}
+
+
+# ==========================================
+# 2. LIBRO EN MEMORIA (CON COPIA EN DISCO OPCIONAL)
+# ==========================================
+# Responde como la API: todo se lee como texto, sin celdas ni filas vacías
+# al final, y batch_update valida el lote completo antes de aplicarlo.
+# `latencia` (segundos) se espera en cada llamada para simular la red.
+def _texto(valor):
+    if isinstance(valor, bool):
+        return "TRUE" if valor else "FALSE"
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return "" if valor is None else str(valor)
+
+
+def _recortar(filas):
+    filas = [list(f) for f in filas]
+    for f in filas:
+        while f and f[-1] == "":
+            f.pop()
+    while filas and not filas[-1]:
+        filas.pop()
+    return filas
+
+
+def _separar(rango):
+    # "'HOJA'!A2:F" -> ("HOJA", "A2:F")
+    nombre, _, a1 = rango.partition("!")
+    if nombre.startswith("'"):
+        nombre = nombre[1:-1].replace("''", "'")
+    return nombre, a1
+
+
+def _valor_celda(celda):
+    valor = celda.get("userEnteredValue")
+    return next(iter(valor.values())) if valor else ""
+
+
+class HojaMemoria:
+    def __init__(self, libro, id_hoja, titulo, filas):
+        self.libro = libro
+        self.id = id_hoja
+        self.title = titulo
+        self.filas = filas
+
+    def _bloque(self, a1, por_columnas=False):
+        g = a1_range_to_grid_range(a1) if a1 else {}
+        f0, f1 = g.get("startRowIndex", 0), g.get("endRowIndex")
+        c0 = g.get("startColumnIndex", 0)
+        filas = self.filas[f0:f1]
+        c1 = g.get("endColumnIndex", max((len(f) for f in filas), default=0))
+        bloque = [[_texto(v) for v in (f + [""] * c1)[c0:c1]] for f in filas]
+        return _recortar(zip(*bloque) if por_columnas else bloque)
+
+    def _escribir(self, f0, c0, filas):
+        for i, fila in enumerate(filas):
+            while len(self.filas) <= f0 + i:
+                self.filas.append([])
+            destino = self.filas[f0 + i]
+            if len(destino) < c0 + len(fila):
+                destino.extend([""] * (c0 + len(fila) - len(destino)))
+            destino[c0:c0 + len(fila)] = fila
+
+    def row_values(self, fila):
+        self.libro._esperar()
+        with self.libro._lock:
+            return (self._bloque(f"{fila}:{fila}") or [[]])[0]
+
+    def get(self, rango):
+        self.libro._esperar()
+        with self.libro._lock:
+            return self._bloque(rango)
+
+    def update(self, range_name=None, values=None, **kwargs):
+        self.libro._esperar()
+        g = a1_range_to_grid_range(range_name or "A1")
+        with self.libro._lock:
+            self._escribir(g.get("startRowIndex", 0), g.get("startColumnIndex", 0), values or [])
+            self.libro._guardar()
+
+    def append_row(self, values, value_input_option=None, table_range=None, **kwargs):
+        # Como values.append: la respuesta trae el rango donde quedó la fila
+        self.libro._esperar()
+        with self.libro._lock:
+            while self.filas and all(v == "" for v in self.filas[-1]):
+                self.filas.pop()
+            self.filas.append(list(values))
+            n = len(self.filas)
+            self.libro._guardar()
+        rango = f"'{self.title}'!A{n}:{rowcol_to_a1(n, max(len(values), 1))}"
+        return {"spreadsheetId": self.libro.id, "updates": {"updatedRange": rango, "updatedRows": 1}}
+
+
+class LibroMemoria:
+    def __init__(self, hojas=None, ruta=None, latencia=0.0):
+        self.id = f"memoria:{os.path.abspath(ruta)}" if ruta else f"memoria:{id(self)}"
+        self.ruta = ruta
+        self.latencia = latencia
+        self.llamadas = 0  # llamadas "a la API" (para los benchmarks)
+        self._lock = threading.RLock()
+        self._hojas = {}
+        for titulo, filas in (hojas or {}).items():
+            self._hojas[titulo] = HojaMemoria(self, len(self._hojas) + 1, titulo, [list(f) for f in filas])
+
+    @classmethod
+    def abrir(cls, ruta=None, latencia=0.0):
+        # Libro guardado en `ruta` (JSON) o uno nuevo con los encabezados
+        if ruta and os.path.exists(ruta):
+            with open(ruta, encoding="utf-8") as f:
+                return cls(json.load(f), ruta, latencia)
+        libro = cls({n: [enc] for n, enc in ENCABEZADOS.items()}, ruta, latencia)
+        libro._guardar()
+        return libro
+
+    def _esperar(self):
+        self.llamadas += 1
+        if self.latencia:
+            time.sleep(self.latencia)
+
+    def _guardar(self):
+        if not self.ruta:
+            return
+        temporal = self.ruta + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump({t: h.filas for t, h in self._hojas.items()}, f, ensure_ascii=False)
+        os.replace(temporal, self.ruta)
+
+    # --- Metadatos ---
+    def worksheets(self):
+        self._esperar()
+        with self._lock:
+            return list(self._hojas.values())
+
+    def worksheet(self, titulo):
+        self._esperar()
+        with self._lock:
+            if titulo not in self._hojas:
+                raise WorksheetNotFound(titulo)
+            return self._hojas[titulo]
+
+    def add_worksheet(self, title, rows, cols):
+        self._esperar()
+        with self._lock:
+            if title in self._hojas:
+                raise ValueError(f"Ya existe una hoja llamada {title}")
+            ws = HojaMemoria(self, max((h.id for h in self._hojas.values()), default=0) + 1, title, [])
+            self._hojas[title] = ws
+            self._guardar()
+            return ws
+
+    # --- Lectura ---
+    def values_batch_get(self, ranges, params=None):
+        self._esperar()
+        por_columnas = (params or {}).get("majorDimension") == "COLUMNS"
+        respuesta = []
+        with self._lock:
+            for rango in ranges:
+                nombre, a1 = _separar(rango)
+                if nombre not in self._hojas:
+                    raise WorksheetNotFound(nombre)
+                valores = self._hojas[nombre]._bloque(a1, por_columnas)
+                respuesta.append({"range": rango, "values": valores} if valores else {"range": rango})
+        return {"spreadsheetId": self.id, "valueRanges": respuesta}
+
+    # --- Escritura ---
+    def batch_update(self, body):
+        self._esperar()
+        pedidos = body.get("requests", [])
+        with self._lock:
+            por_id = {h.id: h for h in self._hojas.values()}
+            # Todo o nada: primero se valida el lote completo
+            for pedido in pedidos:
+                tipo, datos = next(iter(pedido.items()))
+                id_hoja = (datos.get("range") or datos.get("start") or datos)["sheetId"]
+                if tipo not in ("appendCells", "updateCells", "appendDimension", "deleteDimension"):
+                    raise ValueError(f"Pedido no soportado: {tipo}")
+                if id_hoja not in por_id:
+                    raise WorksheetNotFound(str(id_hoja))
+            for pedido in pedidos:
+                tipo, datos = next(iter(pedido.items()))
+                if tipo == "appendCells":
+                    ws = por_id[datos["sheetId"]]
+                    # Se agrega después de la última fila con datos
+                    while ws.filas and all(v == "" for v in ws.filas[-1]):
+                        ws.filas.pop()
+                    ws.filas.extend([_valor_celda(c) for c in fila.get("values", [])] for fila in datos["rows"])
+                elif tipo == "updateCells":
+                    inicio = datos["start"]
+                    filas = [[_valor_celda(c) for c in fila.get("values", [])] for fila in datos["rows"]]
+                    por_id[inicio["sheetId"]]._escribir(inicio["rowIndex"], inicio["columnIndex"], filas)
+                elif tipo == "appendDimension":
+                    por_id[datos["sheetId"]].filas.extend([] for _ in range(datos["length"]))
+                else:
+                    rango = datos["range"]
+                    del por_id[rango["sheetId"]].filas[rango["startIndex"]:rango["endIndex"]]
+            self._guardar()
+        return {"spreadsheetId": self.id, "replies": [{} for _ in pedidos]}
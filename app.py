@@ -1,28 +1,39 @@
 import streamlit as st
-import pandas as pd
-import gspread
-from google.oauth2.service_account import Credentials
-import hashlib
+import os
 from datetime import datetime
+from pathlib import Path
+
+# El login solo necesita acceso.py; pandas, gspread y los módulos de datos se
+# importan ya dentro del sistema (en frío, el hilo de arranque los adelanta)
+from acceso import (LIBRO_DEFAULT, logias, connect_db, iniciar_conexion, credencial_guardada,
+                    make_hash, check_hashes)
 
 # ==========================================
 # 1. CONFIGURACIÓN Y CONEXIÓN
 # ==========================================
 st.set_page_config(page_title="Portal del Taller", page_icon="∴", layout="wide")
 
-def make_hash(password):
-    return hashlib.sha256(str.encode(password)).hexdigest()
-
-def check_hashes(password, hashed_text):
-    return make_hash(password) == hashed_text
-
-@st.cache_resource
-def connect_db():
-    scope = ['https://www.googleapis.com/auth/spreadsheets', "https://www.googleapis.com/auth/drive"]
-    creds = Credentials.from_service_account_info(st.secrets["gcp_service_account"], scopes=scope)
-    client = gspread.authorize(creds)
-    # ⚠️ ASEGÚRATE DE QUE ESTE NOMBRE SEA EL CORRECTO
-    return client.open("Sec y Tes")
+# Columnas de DIRECTORIO que necesita cada vista (el resto no se descarga)
+COLS_LISTA = ["ID_H", "Nombre_Completo", "Grado_Actual", "Estatus"]
+COLS_EXPEDIENTE = ["Nombre_Completo", "Grado_Actual", "Email", "Tel_Celular", "Direccion", "Profesion", "Lugar_Trabajo",
+                   "Tipo_Sangre", "Alergias", "Contacto_Emergencia", "Beneficiario", "Fecha_Inic", "Historial_Cargos"]
+COLS_PAGOS = ["ID_H", "Nombre_Completo", "Estatus"]
+COLS_ALTA = ["ID_H", "Nombre_Completo"]  # el expediente a editar se lee por fila
+# Las fechas llegan tipadas (esquema.py): se muestran como en la hoja
+FECHA_COL = st.column_config.DateColumn(format="DD/MM/YYYY")
+
+# Lo que lee cada vista, para precargarlo al entrar (mismas hojas/columnas)
+LECTURAS_VISTA = {
+    "Mi Tablero": ["ASISTENCIAS", "SALDOS"],
+    "Detalle Tesorería": ["TESORERIA", "SALDOS"],
+    "OFICIAL: Secretaría": [("DIRECTORIO", COLS_LISTA), "ASISTENCIAS"],
+    "OFICIAL: Tesorería": [("DIRECTORIO", COLS_PAGOS), "LIBRO_CAJA"],
+    "ADMIN: Alta HH:.": [("DIRECTORIO", COLS_ALTA)],
+    "CONSULTA: Expedientes": [("DIRECTORIO", COLS_EXPEDIENTE)],
+    "CONSULTA: Cápitas Global": ["TESORERIA", ("DIRECTORIO", COLS_LISTA)],
+    "CONSULTA: Asistencia Global": ["ASISTENCIAS", ("DIRECTORIO", COLS_LISTA)],
+    "CONSULTA: Maestro (Total)": ["LIBRO_CAJA"],
+}
 
 # ==========================================
 # 2. LÓGICA DE ROLES (PERMISOS)
@@ -33,11 +44,11 @@ def obtener_menu_por_rol(rol):
     
     # SECRETARIO (Único con permiso de Alta y Pase de Lista)
     if rol == "Secretario":
-        opciones.extend(["OFICIAL: Secretaría", "ADMIN: Alta HH:.", "CONSULTA: Cápitas Global", "ADMIN: Mantenimiento"])
+        opciones.extend(["OFICIAL: Secretaría", "ADMIN: Alta HH:.", "CONSULTA: Cápitas Global", "ADMIN: Mantenimiento", "ADMIN: Diagnóstico"])
         
     # TESORERO (Único con permiso de mover dinero)
     elif rol == "Tesorero":
-        opciones.extend(["OFICIAL: Tesorería", "CONSULTA: Asistencia Global", "ADMIN: Mantenimiento"])
+        opciones.extend(["OFICIAL: Tesorería", "CONSULTA: Asistencia Global", "ADMIN: Mantenimiento", "ADMIN: Diagnóstico"])
         
     # HOSPITALARIO (Lectura total de expedientes y asistencia)
     elif rol == "Hospitalario":
@@ -49,10 +60,20 @@ def obtener_menu_por_rol(rol):
         
     # VENERABLE MAESTRO (Acceso Total de Lectura + Tablero de Control)
     elif rol == "Venerable Maestro":
-        opciones.extend(["CONSULTA: Maestro (Total)", "CONSULTA: Expedientes", "CONSULTA: Cápitas Global", "CONSULTA: Asistencia Global", "ADMIN: Mantenimiento"])
+        opciones.extend(["CONSULTA: Maestro (Total)", "CONSULTA: Expedientes", "CONSULTA: Cápitas Global", "CONSULTA: Asistencia Global", "ADMIN: Mantenimiento", "ADMIN: Diagnóstico"])
     
     return opciones
 
+def lecturas_del_rol(rol):
+    return [l for vista in obtener_menu_por_rol(rol) for l in LECTURAS_VISTA.get(vista, [])]
+
+def guardar_en_sesion(user_row):
+    # Igual si la fila viene de DIRECTORIO o de la copia local de credenciales
+    st.session_state['role'] = user_row['Rol']
+    st.session_state['id_h'] = int(user_row['ID_H'])
+    st.session_state['nombre'] = user_row['Nombre_Completo']
+    st.session_state['grado_actual'] = int(user_row['Grado_Actual'])
+
 # ==========================================
 # 3. INTERFAZ PRINCIPAL
 # ==========================================
@@ -66,25 +87,38 @@ def main():
         with col2:
             st.title("∴ Acceso al Taller")
             st.markdown("---")
+            opciones_logia = list(logias())
+            logia = st.selectbox("Logia", opciones_logia) if len(opciones_logia) > 1 else opciones_logia[0]
+            # El libro se abre en segundo plano mientras se escribe la contraseña
+            iniciar_conexion(logia)
             username = st.text_input("Usuario")
             password = st.text_input("Contraseña", type='password')
             
+            if st.session_state.get('aviso_login'):
+                st.warning(st.session_state.pop('aviso_login'))
+
             if st.button("Entrar", use_container_width=True):
                 try:
-                    sh = connect_db()
-                    ws = sh.worksheet("DIRECTORIO")
-                    df = pd.DataFrame(ws.get_all_records())
-                    user_row = df[df['Usuario'] == username]
+                    # Primero la copia local de credenciales: no espera a Sheets
+                    user_row = credencial_guardada(logia, username)
+                    de_copia = user_row is not None and check_hashes(password, user_row['Password'])
+                    if not de_copia:
+                        from datos import buscar_usuario
+                        from metricas import etiquetar_vista
+                        etiquetar_vista("Login", logia)
+                        # Índice en memoria: sin llamada a la red salvo la primera vez
+                        user_row = buscar_usuario(connect_db(logia), username)
                     
-                    if not user_row.empty:
-                        stored_hash = user_row.iloc[0]['Password']
+                    if user_row:
+                        stored_hash = user_row['Password']
                         if check_hashes(password, stored_hash):
                             st.session_state['logged_in'] = True
+                            st.session_state['logia'] = logia
                             st.session_state['username'] = username
-                            st.session_state['role'] = user_row.iloc[0]['Rol']
-                            st.session_state['id_h'] = str(user_row.iloc[0]['ID_H'])
-                            st.session_state['nombre'] = user_row.iloc[0]['Nombre_Completo']
-                            st.session_state['grado_actual'] = int(user_row.iloc[0]['Grado_Actual'])
+                            guardar_en_sesion(user_row)
+                            # El primer rerun dentro confirma la copia y precarga las vistas
+                            st.session_state['entrada'] = "copia" if de_copia else "directorio"
+                            st.session_state['hash_copia'] = stored_hash if de_copia else None
                             st.rerun()
                         else:
                             st.error("Contraseña incorrecta.")
@@ -95,9 +129,14 @@ def main():
 
     # --- SISTEMA DENTRO ---
     else:
+        # Barra lateral primero: "Cerrar Sesión" queda disponible aunque
+        # Sheets no responda
+        logia = st.session_state.get('logia', LIBRO_DEFAULT)
         rol_actual = st.session_state['role']
         st.sidebar.title(f"H:. {st.session_state['nombre']}")
         st.sidebar.caption(f"Rol: {rol_actual} | Grado: {st.session_state['grado_actual']}º")
+        if len(logias()) > 1:
+            st.sidebar.caption(f"Logia: {logia}")
         
         opciones_menu = obtener_menu_por_rol(rol_actual)
         menu = st.sidebar.radio("Navegación", opciones_menu)
@@ -106,32 +145,60 @@ def main():
             st.session_state['logged_in'] = False
             st.rerun()
 
-        sh = connect_db()
+        # Lo que usan todas las vistas; cada vista importa además lo suyo
+        # (en frío, el hilo de arranque ya los importó)
+        from datos import leer_hoja, leer_columnas, buscar_usuario, movimientos, en_paralelo, precargar, LoteEscritura
+        from metricas import etiquetar_vista, medir
+        etiquetar_vista(menu, logia)
+
+        entrada = st.session_state.pop('entrada', None)
+        try:
+            sh = connect_db(logia)
+            # Entró con la copia local: se confirma contra DIRECTORIO antes de mostrar nada
+            user_row = buscar_usuario(sh, st.session_state['username']) if entrada == "copia" else None
+        except Exception as e:
+            if entrada == "copia":
+                st.session_state['logged_in'] = False
+                st.session_state['aviso_login'] = f"No se pudo confirmar tu acceso con el libro: {e}"
+                st.rerun()
+            st.error(f"Error de conexión: {e}")
+            st.stop()
+        if entrada == "copia":
+            if not user_row or user_row['Password'] != st.session_state.pop('hash_copia', None):
+                st.session_state['logged_in'] = False
+                st.session_state['aviso_login'] = "Tus credenciales cambiaron; vuelve a entrar."
+                st.rerun()
+            guardar_en_sesion(user_row)
+        if entrada:
+            # Las vistas del rol se cargan en segundo plano
+            precargar(sh, lecturas_del_rol(st.session_state['role']))
+        if st.session_state['role'] != rol_actual:
+            st.rerun()  # DIRECTORIO trae otro rol que la copia: se rehace el menú
 
         # ---------------------------------------------------------
         # 1. MI TABLERO (VISTA PERSONAL PARA TODOS)
         # ---------------------------------------------------------
         if menu == "Mi Tablero":
+            from calculos import estado_de_cuenta, saldos_por_hermano, MONTO_CAPITA
+            from saldos import saldo_de
             st.title(f"∴ Tablero del H:. {st.session_state['nombre']}")
             st.markdown("---")
             
-            ws_tes = sh.worksheet("TESORERIA")
-            df_tes = pd.DataFrame(ws_tes.get_all_records())
-            df_tes['ID_H'] = df_tes['ID_H'].astype(str)
-            mi_tes = df_tes[df_tes['ID_H'] == st.session_state['id_h']]
-
-            ws_asis = sh.worksheet("ASISTENCIAS")
-            df_asis = pd.DataFrame(ws_asis.get_all_records())
-            mis_asis = pd.DataFrame()
-            if not df_asis.empty:
-                df_asis['ID_H'] = df_asis['ID_H'].astype(str)
-                mis_asis = df_asis[df_asis['ID_H'] == st.session_state['id_h']]
+            # Saldo: una fila de SALDOS; sin esa hoja, se suma el libro del H:.
+            id_h = st.session_state['id_h']
+            datos = en_paralelo(sh, {
+                "asis": lambda: movimientos(sh, ["ASISTENCIAS"], id_h)["ASISTENCIAS"],
+                "saldo": lambda: saldo_de(sh, id_h),
+            })
+            mis_asis, mi_saldo = datos["asis"], datos["saldo"]
+            mi_tes = None
 
             # Cálculos
-            saldo = 0
-            if not mi_tes.empty:
-                mi_tes['Monto'] = pd.to_numeric(mi_tes['Monto'], errors='coerce').fillna(0)
-                saldo = mi_tes[mi_tes['Tipo'] == 'Cargo']['Monto'].sum() - mi_tes[mi_tes['Tipo'] == 'Abono']['Monto'].sum()
+            if mi_saldo is not None:
+                saldo = float(mi_saldo['Saldo'] or 0)
+            else:
+                mi_tes = movimientos(sh, ["TESORERIA"], st.session_state['id_h'])["TESORERIA"]
+                saldo = saldos_por_hermano(mi_tes)['Saldo'].sum() if not mi_tes.empty else 0
             
             pct = 0.0
             if not mis_asis.empty:
@@ -142,7 +209,7 @@ def main():
             k1, k2 = st.columns(2)
             k1.metric("Asistencia Global", f"{pct:.1f}%")
             if saldo > 0:
-                k2.metric("Saldo Pendiente", f"${saldo:,.2f}", f"-{int(saldo/450)} Cápitas aprox", delta_color="inverse")
+                k2.metric("Saldo Pendiente", f"${saldo:,.2f}", f"-{int(saldo/MONTO_CAPITA)} Cápitas aprox", delta_color="inverse")
             else:
                 k2.metric("Estatus", "A Plomo ($0.00)", delta_color="normal")
             
@@ -153,92 +220,112 @@ def main():
                 st.subheader("📅 Historial")
                 if not mis_asis.empty:
                     def col_asis(v): return 'color: green' if v=='Presente' else 'color: red'
-                    st.dataframe(mis_asis[['Fecha_Tenida', 'Estado']].style.map(col_asis, subset=['Estado']), use_container_width=True, hide_index=True)
+                    st.dataframe(mis_asis[['Fecha_Tenida', 'Estado']].style.map(col_asis, subset=['Estado']), use_container_width=True, hide_index=True,
+                                 column_config={"Fecha_Tenida": FECHA_COL})
             
             with c_der:
                 st.subheader("💰 Estado de Cuenta")
-                if not mi_tes.empty:
-                    cargos = mi_tes[mi_tes['Tipo']=='Cargo'].copy()
-                    abonos = mi_tes[mi_tes['Tipo']=='Abono'].copy()
-                    total_pagado = abonos['Monto'].sum()
-                    dinero = total_pagado
-                    res = []
-                    for _,r in cargos.iterrows():
-                        deuda = r['Monto']
-                        est = "Adeudo"
-                        falta = deuda
-                        if dinero >= deuda:
-                            est = "Pagado"
-                            falta = 0
-                            dinero -= deuda
-                        elif dinero > 0:
-                            est = "Parcial"
-                            falta = deuda - dinero
-                            dinero = 0
-                        res.append({"Fecha":r['Fecha'], "Concepto":r['Concepto'], "Estatus":est, "Falta":falta})
-                    
-                    df_v = pd.DataFrame(res).iloc[::-1]
+                # El detalle necesita el libro: solo se consulta si se pide
+                if mi_tes is None and st.toggle("Ver detalle de cargos", key="ver_edo_cta"):
+                    mi_tes = movimientos(sh, ["TESORERIA"], st.session_state['id_h'])["TESORERIA"]
+                if mi_tes is not None and not mi_tes.empty:
+                    with medir("estado_de_cuenta"):
+                        df_v = estado_de_cuenta(mi_tes)[["Fecha", "Concepto", "Estatus", "Falta"]].iloc[::-1]
                     def col_tes(v): return 'color: green' if v=='Pagado' else ('color: orange; font-weight: bold' if v=='Parcial' else 'color: red')
-                    st.dataframe(df_v.style.map(col_tes, subset=['Estatus']).format({"Falta":"${:,.0f}"}), use_container_width=True, hide_index=True)
+                    st.dataframe(df_v.style.map(col_tes, subset=['Estatus']).format({"Falta":"${:,.0f}"}), use_container_width=True, hide_index=True,
+                                 column_config={"Fecha": FECHA_COL})
 
         elif menu == "Detalle Tesorería":
+            import pandas as pd
+            from saldos import saldo_de
             st.title("💰 Historial Detallado de Pagos")
             # (Simplificado: Muestra tabla cruda de abonos para referencia)
-            ws_tes = sh.worksheet("TESORERIA")
-            df = pd.DataFrame(ws_tes.get_all_records())
-            df['ID_H'] = df['ID_H'].astype(str)
-            mis_movs = df[(df['ID_H'] == st.session_state['id_h']) & (df['Tipo'] == 'Abono')]
-            st.dataframe(mis_movs, use_container_width=True, hide_index=True)
+            id_h = st.session_state['id_h']
+            datos = en_paralelo(sh, {
+                "saldo": lambda: saldo_de(sh, id_h),
+                "tes": lambda: movimientos(sh, ["TESORERIA"], id_h)["TESORERIA"],
+            })
+            mi_saldo, mi_tes = datos["saldo"], datos["tes"]
+            if mi_saldo is not None:
+                k1, k2, k3 = st.columns(3)
+                k1.metric("Total Abonado", f"${float(mi_saldo['Abonos'] or 0):,.2f}")
+                k2.metric("Saldo", f"${float(mi_saldo['Saldo'] or 0):,.2f}")
+                ultimo = mi_saldo['Ultimo_Movimiento']
+                k3.metric("Último Movimiento", "-" if pd.isna(ultimo) else ultimo.strftime("%d/%m/%Y"))
+            mis_movs = mi_tes[mi_tes['Tipo'] == 'Abono']
+            st.dataframe(mis_movs, use_container_width=True, hide_index=True, column_config={"Fecha": FECHA_COL})
 
 
         # ---------------------------------------------------------
         # 2. OFICIAL: SECRETARÍA (PASE DE LISTA)
         # ---------------------------------------------------------
         elif menu == "OFICIAL: Secretaría":
+            from calculos import resumen_asistencia, lista_de_tenida, ESTADOS_ASISTENCIA
             st.header("📜 Gestión de Secretaría")
             t_lista, t_rep = st.tabs(["📝 Pase de Lista", "📊 Reporte de Asistencia"])
+            datos = en_paralelo(sh, {
+                "hh": lambda: leer_columnas(sh, "DIRECTORIO", COLS_LISTA),
+                "as": lambda: leer_hoja(sh, "ASISTENCIAS"),
+            })
+            df_hh, df_as = datos["hh"], datos["as"]
             
             with t_lista:
                 fecha = st.date_input("Fecha Tenida", datetime.today())
                 grado = st.selectbox("Grado", [1,2,3])
-                ws_dir = sh.worksheet("DIRECTORIO")
-                df_hh = pd.DataFrame(ws_dir.get_all_records())
                 
                 if not df_hh.empty:
-                    hh = df_hh[df_hh['Grado_Actual'] >= grado]
-                    with st.form("lista"):
-                        st.write(f"Convocados: {len(hh)}")
-                        estados = {}
-                        for _, r in hh.iterrows():
-                            c1,c2 = st.columns([3,2])
-                            c1.write(f"**{r['Nombre_Completo']}**")
-                            estados[r['ID_H']] = c2.radio("Edo", ["Presente","Falta","Justif.","Retardo"], key=r['ID_H'], horizontal=True, label_visibility="collapsed")
-                            st.divider()
-                        if st.form_submit_button("Guardar"):
-                            ws_as = sh.worksheet("ASISTENCIAS")
-                            rows = [[fecha.strftime("%d/%m/%Y"), grado, str(id), est, ""] for id, est in estados.items()]
-                            ws_as.append_rows(rows)
-                            st.success("Guardado.")
+                    # Una sola tabla editable; solo los HH:. sin registro de esta tenida
+                    lista, ya = lista_de_tenida(df_as, df_hh, fecha, grado)
+                    st.write(f"Convocados: {len(lista) + ya}")
+                    if ya:
+                        st.warning(f"Esta tenida ya tiene {ya} registros; solo se listan los HH:. que faltan.")
+                    
+                    # Estados elegidos (por ID_H) en la sesión: sobreviven al filtro.
+                    # Cambiar el filtro o marcar todos reinicia la tabla (versión nueva).
+                    clave = f"lista_{fecha}_{grado}"
+                    version = f"{clave}_v"
+                    estados = st.session_state.setdefault(clave, {})
+                    def nueva_version(): st.session_state[version] = st.session_state.get(version, 0) + 1
+                    
+                    f1, f2, f3 = st.columns([3,2,1], vertical_alignment="bottom")
+                    filtro = f1.text_input("Filtrar por nombre", key="lista_filtro", on_change=nueva_version)
+                    marca = f2.selectbox("Marcar todos como", ESTADOS_ASISTENCIA, key="lista_marca")
+                    visibles = lista[lista['Nombre'].str.contains(filtro, case=False, regex=False)] if filtro else lista
+                    if f3.button("Marcar", use_container_width=True):
+                        estados.update(dict.fromkeys(visibles['ID_H'], marca))
+                        nueva_version()
+                    
+                    ed = st.data_editor(
+                        visibles.assign(Estado=visibles['ID_H'].map(lambda i: estados.get(i, ESTADOS_ASISTENCIA[0]))),
+                        key=f"{clave}_{st.session_state.get(version, 0)}", hide_index=True, use_container_width=True,
+                        disabled=["ID_H", "Nombre"],
+                        column_config={"Estado": st.column_config.SelectboxColumn(options=ESTADOS_ASISTENCIA, required=True)},
+                    )
+                    estados.update(zip(ed['ID_H'], ed['Estado']))
+                    
+                    if st.button("Guardar", disabled=lista.empty):
+                        # Todos los pendientes (los no tocados van como Presente) en un lote
+                        rows = [[fecha.strftime("%d/%m/%Y"), grado, int(i), estados.get(i, ESTADOS_ASISTENCIA[0]), ""] for i in lista['ID_H']]
+                        try:
+                            LoteEscritura(sh).anexar("ASISTENCIAS", rows).ejecutar()
+                            st.session_state.pop(clave, None)
+                            st.success(f"Guardado: {len(rows)} HH:.")
+                        except Exception as e:
+                            st.error(f"No se guardó la lista: {e}")
             
             with t_rep:
-                # REPORTE BLINDADO
-                ws_as = sh.worksheet("ASISTENCIAS")
-                df_as = pd.DataFrame(ws_as.get_all_records())
-                ws_dir = sh.worksheet("DIRECTORIO")
-                df_dir = pd.DataFrame(ws_dir.get_all_records())
+                # REPORTE BLINDADO (una sola pasada agrupada)
+                r1, r2, r3 = st.columns(3)
+                desde = r1.date_input("Desde", None, key="rep_desde")
+                hasta = r2.date_input("Hasta", None, key="rep_hasta")
+                g_rep = r3.selectbox("Grado", ["Todos", 1, 2, 3], key="rep_grado")
                 
-                if not df_dir.empty and not df_as.empty:
-                    df_as['ID_H'] = df_as['ID_H'].astype(str)
-                    stats = []
-                    for _, h in df_dir[df_dir['Estatus']=='Activo'].iterrows():
-                        regs = df_as[df_as['ID_H']==str(h['ID_H'])]
-                        tot = len(regs)
-                        ok = len(regs[regs['Estado'].isin(['Presente','Retardo'])])
-                        pct = (ok/tot*100) if tot>0 else 0
-                        stats.append({"Nombre":h['Nombre_Completo'], "% Asist":pct})
+                if not df_hh.empty and not df_as.empty:
+                    with medir("resumen_asistencia"):
+                        df_s = resumen_asistencia(df_as, df_hh, desde=desde, hasta=hasta, grado=None if g_rep == "Todos" else g_rep)
                     
-                    if stats:
-                        df_s = pd.DataFrame(stats).sort_values(by="% Asist")
+                    if not df_s.empty:
+                        df_s = df_s[["Nombre", "Tenidas", "% Asist"]].sort_values(by="% Asist")
                         st.dataframe(df_s.style.format({"% Asist":"{:.1f}%"}), use_container_width=True)
                     else:
                         st.info("Sin datos suficientes.")
@@ -250,52 +337,59 @@ def main():
         # 3. OFICIAL: TESORERÍA (GESTIÓN DE DINERO)
         # ---------------------------------------------------------
         elif menu == "OFICIAL: Tesorería":
+            from calculos import MONTO_CAPITA
+            from caja import mayor_de_caja
+            from estados import generar_estados, ruta_zip_nuevo
+            from saldos import registrar_en_tesoreria
             st.header("⚖️ Gestión de Tesorería")
-            MONTO_CAPITA = 450.0
-            tabs = st.tabs(["⚡ Cápitas Masivas", "Balance", "Pago Individual", "Gastos"])
+            tabs = st.tabs(["⚡ Cápitas Masivas", "Balance", "Pago Individual", "Gastos", "📬 Estados de Cuenta"])
+            datos = en_paralelo(sh, {
+                "hh": lambda: leer_columnas(sh, "DIRECTORIO", COLS_PAGOS),
+                "cj": lambda: leer_hoja(sh, "LIBRO_CAJA"),
+            })
+            df_hh, df_cj = datos["hh"], datos["cj"]
             
             with tabs[0]: # MASIVA
                 mes = st.selectbox("Mes", ["Enero","Febrero","Marzo","Abril","Mayo","Junio","Julio","Agosto","Septiembre","Octubre","Noviembre","Diciembre"])
-                ws_dir = sh.worksheet("DIRECTORIO")
-                df_hh = pd.DataFrame(ws_dir.get_all_records())
                 if not df_hh.empty:
                     cands = df_hh[df_hh['Estatus']=='Activo'][['ID_H','Nombre_Completo']]
                     cands['COBRAR'] = True
                     ed = st.data_editor(cands, hide_index=True, use_container_width=True)
                     if st.button("Generar Cargos"):
                         sel = ed[ed['COBRAR']==True]
-                        ws_tes = sh.worksheet("TESORERIA")
                         hoy = datetime.today().strftime("%d/%m/%Y")
-                        rows = [[hoy, str(r['ID_H']), f"Cápita {mes}", "Cargo", MONTO_CAPITA] for _,r in sel.iterrows()]
-                        ws_tes.append_rows(rows)
-                        st.success(f"Cargados {len(rows)} HH:.")
+                        rows = [[hoy, int(r['ID_H']), f"Cápita {mes}", "Cargo", MONTO_CAPITA] for _,r in sel.iterrows()]
+                        try:
+                            registrar_en_tesoreria(sh, rows)
+                            st.success(f"Cargados {len(rows)} HH:.")
+                        except Exception as e:
+                            st.error(f"No se generó ningún cargo: {e}")
             
             with tabs[1]: # BALANCE
-                ws_cj = sh.worksheet("LIBRO_CAJA")
-                df_cj = pd.DataFrame(ws_cj.get_all_records())
                 if 'Entrada' in df_cj.columns:
-                    ent = pd.to_numeric(df_cj['Entrada'], errors='coerce').sum()
-                    sal = pd.to_numeric(df_cj['Salida'], errors='coerce').sum()
-                    st.metric("Caja Real", f"${ent-sal:,.2f}")
+                    with medir("mayor_de_caja"):
+                        mayor = mayor_de_caja(sh, df_cj)
+                    st.metric("Caja Real", f"${mayor.saldo():,.2f}")
+                    st.dataframe(mayor.flujo_mensual().iloc[::-1].style.format("${:,.2f}"), use_container_width=True)
                 else:
                     st.error("Error en columnas de Caja.")
 
             with tabs[2]: # INDIVIDUAL
                 with st.form("pagind"):
-                    ws_dir = sh.worksheet("DIRECTORIO")
-                    noms = ws_dir.col_values(2)[1:]
-                    ids = ws_dir.col_values(1)[1:]
-                    dic = dict(zip(noms, ids))
+                    noms = df_hh['Nombre_Completo'].astype(str).tolist()
+                    dic = dict(zip(noms, df_hh['ID_H']))
                     h = st.selectbox("Hermano", noms)
                     m = st.number_input("Monto", min_value=0.0)
                     c = st.text_input("Concepto", "Abono")
                     if st.form_submit_button("Registrar"):
-                        ws_tes = sh.worksheet("TESORERIA")
-                        ws_cj = sh.worksheet("LIBRO_CAJA")
                         fe = datetime.today().strftime("%d/%m/%Y")
-                        ws_tes.append_row([fe, str(dic[h]), c, "Abono", m])
-                        ws_cj.append_row([fe, f"{c} ({h})", "Ingreso", m, 0, ""])
-                        st.success("Registrado.")
+                        # Tesorería, Saldos y Caja en un solo lote: se guardan todas o ninguna
+                        lote = LoteEscritura(sh).anexar("LIBRO_CAJA", [[fe, f"{c} ({h})", "Ingreso", m, 0, ""]])
+                        try:
+                            registrar_en_tesoreria(sh, [[fe, int(dic[h]), c, "Abono", m]], lote)
+                            st.success("Registrado.")
+                        except Exception as e:
+                            st.error(f"No se registró el pago: {e}")
 
             with tabs[3]: # GASTOS
                 with st.form("gst"):
@@ -304,28 +398,59 @@ def main():
                     cat = st.selectbox("Cat", ["Operativo","GL","Evento"])
                     m = st.number_input("Monto", min_value=0.0)
                     if st.form_submit_button("Registrar Salida"):
-                        ws_cj = sh.worksheet("LIBRO_CAJA")
-                        ws_cj.append_row([f.strftime("%d/%m/%Y"), c, cat, 0, m, ""])
-                        st.success("Gasto guardado.")
+                        try:
+                            LoteEscritura(sh).anexar("LIBRO_CAJA", [[f.strftime("%d/%m/%Y"), c, cat, 0, m, ""]]).ejecutar()
+                            st.success("Gasto guardado.")
+                        except Exception as e:
+                            st.error(f"No se guardó el gasto: {e}")
+
+            with tabs[4]: # ESTADOS DE CUENTA DE TODOS (ZIP)
+                st.caption("Un CSV y un HTML por H:. activo, más resumen.csv. Los libros se leen una sola vez.")
+                corte = st.date_input("Corte al", datetime.today(), key="edo_corte")
+                if st.button("Generar estados de cuenta"):
+                    barra = st.progress(0.0, text="Leyendo libros...")
+                    libros = en_paralelo(sh, {
+                        "tes": lambda: leer_hoja(sh, "TESORERIA"),
+                        "as": lambda: leer_hoja(sh, "ASISTENCIAS"),
+                        "dir": lambda: leer_columnas(sh, "DIRECTORIO", COLS_LISTA),
+                    })
+                    # El ZIP se escribe a disco; solo se lee al descargarlo
+                    previo = st.session_state.pop('estados_zip', None)
+                    if previo and os.path.exists(previo[0]):
+                        os.remove(previo[0])
+                    ruta_zip = ruta_zip_nuevo()
+                    try:
+                        with medir("generar_estados"):
+                            res_edo, sin_id = generar_estados(libros["tes"], libros["as"], libros["dir"], ruta_zip, corte,
+                                                      lambda n, total: barra.progress(n / total, text=f"{n} de {total} HH:."))
+                        st.session_state['estados_zip'] = (ruta_zip, f"estados_{corte:%Y%m%d}.zip", len(res_edo))
+                        if sin_id:
+                            st.warning(f"Sin ID_H en DIRECTORIO (no van en el ZIP): {', '.join(sin_id)}")
+                    except Exception as e:
+                        os.remove(ruta_zip)
+                        st.error(f"No se generaron los estados: {e}")
+                if 'estados_zip' in st.session_state and not os.path.exists(st.session_state['estados_zip'][0]):
+                    st.session_state.pop('estados_zip')  # venció (ver estados.ruta_zip_nuevo)
+                if 'estados_zip' in st.session_state:
+                    ruta_zip, nombre_zip, n_edo = st.session_state['estados_zip']
+                    st.download_button(f"⬇️ Descargar ZIP ({n_edo} HH:.)", data=Path(ruta_zip).read_bytes,
+                                       file_name=nombre_zip, mime="application/zip")
 
 
         # ---------------------------------------------------------
         # 4. ADMIN: ALTA HH:. (SOLO SECRETARIO - FORMULARIO 33 CAMPOS)
         # ---------------------------------------------------------
         elif menu == "ADMIN: Alta HH:.":
+            from datos import leer_expediente, guardar_expediente
+            from folios import alta_expediente
             st.header("🗂️ Alta de Expedientes")
             t_alta, t_edit = st.tabs(["Alta Nuevo", "Editar Existente"])
             
             with t_alta:
-                ws_dir = sh.worksheet("DIRECTORIO")
-                df_d = pd.DataFrame(ws_dir.get_all_records())
-                next_id = 1
-                if not df_d.empty:
-                    ids = pd.to_numeric(df_d['ID_H'], errors='coerce')
-                    if not ids.empty: next_id = int(ids.max()) + 1
-                
+                # El ID_H se reserva al guardar (folios.py): no se lee el directorio
                 with st.form("alta"):
-                    st.subheader(f"Nuevo ID: {next_id}")
+                    st.subheader("Nuevo Expediente")
+                    st.caption("El ID se asigna al crear el expediente.")
                     c1,c2 = st.columns(2)
                     nom = c1.text_input("Nombre Completo")
                     usr = c2.text_input("Usuario")
@@ -342,34 +467,41 @@ def main():
                     emerg = st.text_input("Contacto Emergencia y Tel")
                     
                     if st.form_submit_button("Crear Expediente"):
-                        phash = make_hash(pas)
-                        # Relleno simplificado para no hacer las 33 lineas aqui, pero el Excel debe tener las columnas
-                        # Orden clave: ID, Nombre, User, Pass, Reset, Rol, Grado, Estatus... Resto vacios
-                        row = [next_id, nom, usr, phash, "TRUE", rol, gr, "Activo", "", "", tel, mail, "", datetime.today().strftime("%d/%m/%Y"), "", "", job, "", "", "", "", sangre, "", "", "", "", emerg]
-                        # Rellenar con vacíos hasta completar columnas si es necesario
-                        while len(row) < 33: row.append("")
-                        
-                        ws_dir.append_row(row)
-                        st.success("Creado.")
+                        if not nom.strip() or not usr.strip():
+                            st.error("Nombre y Usuario son obligatorios.")
+                        elif buscar_usuario(sh, usr.strip()):
+                            # Índice del login en memoria (se refresca si el usuario no aparece)
+                            st.error(f"El usuario '{usr.strip()}' ya existe.")
+                        else:
+                            phash = make_hash(pas)
+                            # Relleno simplificado para no hacer las 33 lineas aqui, pero el Excel debe tener las columnas
+                            # Orden clave: (ID), Nombre, User, Pass, Reset, Rol, Grado, Estatus... Resto vacios
+                            row = [nom, usr.strip(), phash, "TRUE", rol, gr, "Activo", "", "", tel, mail, "", datetime.today().strftime("%d/%m/%Y"), "", "", job, "", "", "", "", sangre, "", "", "", "", emerg]
+                            # Rellenar con vacíos hasta completar columnas si es necesario (sin contar el ID)
+                            while len(row) < 32: row.append("")
+                            
+                            try:
+                                nuevo_id = alta_expediente(sh, row, st.session_state['username'])
+                                st.success(f"Creado con ID {nuevo_id}.")
+                            except Exception as e:
+                                st.error(f"No se creó el expediente: {e}")
             with t_edit:
                 st.subheader("✏️ Edición Completa de Expediente")
                 
-                # 1. Cargar datos
-                ws_dir = sh.worksheet("DIRECTORIO")
-                all_records = ws_dir.get_all_records()
-                df_edit = pd.DataFrame(all_records)
+                # 1. Cargar datos (por ID: los nombres pueden repetirse)
+                df_d = leer_columnas(sh, "DIRECTORIO", COLS_ALTA)
+                df_edit = df_d[df_d['ID_H'].notna()]
                 
                 if not df_edit.empty:
                     # Selector de Hermano
-                    opciones_edit = df_edit['Nombre_Completo'].tolist()
-                    seleccion_edit = st.selectbox("Seleccionar Hermano a Editar:", opciones_edit)
+                    nombres_edit = dict(zip(df_edit['ID_H'].astype(int), df_edit['Nombre_Completo'].astype(str)))
+                    id_edit = st.selectbox("Seleccionar Hermano a Editar:", list(nombres_edit),
+                                           format_func=lambda i: f"{nombres_edit[i]} (ID {i})")
+                    # Solo la fila del H:. (índice ID_H -> fila en caché)
+                    datos = leer_expediente(sh, id_edit) if id_edit is not None else None
                     
-                    if seleccion_edit:
-                        # Encontrar índice y datos
-                        idx = df_edit[df_edit['Nombre_Completo'] == seleccion_edit].index[0]
-                        datos = df_edit.iloc[idx]
-                        fila_excel = idx + 2 
-                        
+                    if datos:
+                        seleccion_edit = nombres_edit[id_edit]
                         st.info(f"Editando expediente de: **{seleccion_edit}** (ID: {datos['ID_H']})")
 
                         with st.form("form_edicion_full"):
@@ -490,12 +622,14 @@ def main():
                                         e_cargos
                                     ]
                                     
-                                    # Actualizar en Excel
-                                    rango = f"A{fila_excel}:AG{fila_excel}"
-                                    ws_dir.update(range_name=rango, values=[fila_actualizada])
+                                    # Actualizar en Excel (solo las celdas que cambiaron)
+                                    n_celdas = guardar_expediente(sh, id_edit, datos, fila_actualizada)
                                     
-                                    st.success(f"✅ Expediente de {e_nombre} actualizado.")
-                                    st.rerun()
+                                    if n_celdas:
+                                        st.success(f"✅ Expediente de {e_nombre} actualizado ({n_celdas} campos).")
+                                        st.rerun()
+                                    else:
+                                        st.info("Sin cambios que guardar.")
                                     
                                 except Exception as e:
                                     st.error(f"Error al guardar: {e}")
@@ -508,8 +642,7 @@ def main():
         # ---------------------------------------------------------
         elif menu == "CONSULTA: Expedientes":
             st.header("📂 Expedientes")
-            ws_dir = sh.worksheet("DIRECTORIO")
-            df_dir = pd.DataFrame(ws_dir.get_all_records())
+            df_dir = leer_columnas(sh, "DIRECTORIO", COLS_EXPEDIENTE)
             
             if not df_dir.empty:
                 # FILTRO DE SEGURIDAD VIGILANTES
@@ -552,41 +685,249 @@ def main():
         # 6. CONSULTAS GLOBALES (LECTURA)
         # ---------------------------------------------------------
         elif menu == "CONSULTA: Cápitas Global":
+            from calculos import resumen_deuda, TRAMOS_ADEUDO
             st.header("Estado de Deuda Global")
-            ws_tes = sh.worksheet("TESORERIA")
-            df = pd.DataFrame(ws_tes.get_all_records())
+            datos = en_paralelo(sh, {
+                "tes": lambda: leer_hoja(sh, "TESORERIA"),
+                "dir": lambda: leer_columnas(sh, "DIRECTORIO", COLS_LISTA),
+            })
+            df, df_dir = datos["tes"], datos["dir"]
             if not df.empty:
-                df['Monto'] = pd.to_numeric(df['Monto'], errors='coerce').fillna(0)
-                resumen = df.groupby('ID_H').apply(
-                    lambda x: x[x['Tipo']=='Cargo']['Monto'].sum() - x[x['Tipo']=='Abono']['Monto'].sum()
+                with medir("resumen_deuda"):
+                    resumen = resumen_deuda(df, df_dir)
+                
+                # FILTRO DE SEGURIDAD VIGILANTES
+                if rol_actual == "Primer Vigilante":
+                    resumen = resumen[resumen['Grado'] == 2]
+                    st.info("Mostrando solo Compañeros.")
+                elif rol_actual == "Segundo Vigilante":
+                    resumen = resumen[resumen['Grado'] == 1]
+                    st.info("Mostrando solo Aprendices.")
+                
+                k1, k2 = st.columns(2)
+                k1.metric("Adeudo Total", f"${resumen['Saldo'].clip(lower=0).sum():,.2f}")
+                k2.metric("HH:. con Adeudo", int((resumen['Saldo'] > 0).sum()))
+                
+                tramos = resumen.groupby('Antigüedad', observed=False)['Saldo'].agg(['size', 'sum']).reindex(TRAMOS_ADEUDO)
+                cols_tramo = st.columns(len(TRAMOS_ADEUDO))
+                for col, (tramo, fila) in zip(cols_tramo, tramos.iterrows()):
+                    col.metric(tramo, f"{int(fila['size'])} HH:.", f"${fila['sum']:,.0f}", delta_color="off")
+                
+                st.dataframe(
+                    resumen[['Nombre', 'Grado', 'Estatus', 'Cargo', 'Abono', 'Saldo', 'Cápitas', 'Antigüedad']]
+                    .sort_values(by='Saldo', ascending=False)
+                    .style.format({"Cargo":"${:,.2f}", "Abono":"${:,.2f}", "Saldo":"${:,.2f}", "Cápitas":"{:.1f}"}),
+                    use_container_width=True, hide_index=True
                 )
-                st.dataframe(resumen, use_container_width=True)
         
         elif menu == "CONSULTA: Asistencia Global":
-             st.header("Semáforo Global")
-             # (Misma lógica de reporte, solo lectura)
-             st.info("Visualización de % de asistencia de todos los miembros.")
+            from calculos import resumen_asistencia, semaforo, SEMAFORO_VERDE, SEMAFORO_AMARILLO
+            st.header("Semáforo Global")
+            datos = en_paralelo(sh, {
+                "as": lambda: leer_hoja(sh, "ASISTENCIAS"),
+                "dir": lambda: leer_columnas(sh, "DIRECTORIO", COLS_LISTA),
+            })
+            df_as, df_dir = datos["as"], datos["dir"]
+            
+            # FILTRO DE SEGURIDAD VIGILANTES
+            grado_sem = None
+            if rol_actual == "Primer Vigilante":
+                grado_sem = 2
+                st.info("Mostrando solo Compañeros.")
+            elif rol_actual == "Segundo Vigilante":
+                grado_sem = 1
+                st.info("Mostrando solo Aprendices.")
+            
+            s1, s2 = st.columns(2)
+            desde = s1.date_input("Desde", None, key="sem_desde")
+            hasta = s2.date_input("Hasta", None, key="sem_hasta")
+            
+            if not df_dir.empty and not df_as.empty:
+                with medir("resumen_asistencia"):
+                    df_s = resumen_asistencia(df_as, df_dir, desde=desde, hasta=hasta, grado=grado_sem)
+            else:
+                df_s = None
+            
+            if df_s is None:
+                st.info("Falta información para el semáforo.")
+            elif df_s.empty:
+                st.info("No hay HH:. activos con ese filtro.")
+            else:
+                df_s.insert(0, "", df_s["% Asist"].map(semaforo))
+                k1, k2, k3 = st.columns(3)
+                k1.metric("Promedio del Taller", f"{df_s['% Asist'].mean():.1f}%")
+                k2.metric(f"🟢 ≥ {SEMAFORO_VERDE:.0f}%", int((df_s['% Asist'] >= SEMAFORO_VERDE).sum()))
+                k3.metric(f"🔴 < {SEMAFORO_AMARILLO:.0f}%", int((df_s['% Asist'] < SEMAFORO_AMARILLO).sum()))
+                st.dataframe(df_s.drop(columns=["ID_H"]).sort_values(by="% Asist").style.format({"% Asist":"{:.1f}%"}), use_container_width=True, hide_index=True)
 
         elif menu == "CONSULTA: Maestro (Total)":
+            from caja import mayor_de_caja
             st.header("Tablero de Control V:.M:.")
-            ws_cj = sh.worksheet("LIBRO_CAJA")
-            df = pd.DataFrame(ws_cj.get_all_records())
+            df = leer_hoja(sh, "LIBRO_CAJA")
             if not df.empty:
-                ent = pd.to_numeric(df['Entrada'], errors='coerce').sum()
-                sal = pd.to_numeric(df['Salida'], errors='coerce').sum()
-                st.metric("SALDO TOTAL EN CAJA", f"${ent-sal:,.2f}")
-                st.dataframe(df.tail(10))
+                with medir("mayor_de_caja"):
+                    mayor = mayor_de_caja(sh, df)
+                flujo = mayor.flujo_mensual()
+                st.metric("SALDO TOTAL EN CAJA", f"${mayor.saldo():,.2f}")
+                
+                st.subheader("Flujo mensual")
+                st.bar_chart(flujo[['Entrada', 'Salida']], color=["#2e7d32", "#c62828"], stack=False)
+                st.line_chart(flujo['Cierre'])
+                
+                g1, g2 = st.columns(2)
+                with g1:
+                    st.subheader("Salidas por categoría")
+                    st.bar_chart(mayor.por_categoria('Salida'))
+                with g2:
+                    st.subheader("Entradas por categoría")
+                    st.bar_chart(mayor.por_categoria('Entrada'))
+                st.dataframe(df.tail(10), column_config={"Fecha": FECHA_COL})
 
         # ---------------------------------------------------------
         # 7. MANTENIMIENTO (CIERRE DE AÑO)
         # ---------------------------------------------------------
         elif menu == "ADMIN: Mantenimiento":
+            from cierre import LIBROS, respaldar_ciclo, aplicar_cierre, zip_de_ciclo, ciclos_archivados, archivos_de_ciclo, leer_archivo
+            from saldos import reconstruir_saldos, verificar_saldos
             st.header("Cierre de Ciclo")
-            if st.button("Ejecutar Cierre Anual (Respaldar y Limpiar)"):
-                 st.error("Requiere confirmación manual (función protegida).")
+            t_cierre, t_hist, t_saldos = st.tabs(["🔒 Cierre Anual", "🗄️ Ciclos Archivados", "🧮 Saldos"])
+            
+            with t_cierre:
+                ciclo = st.text_input("Ciclo que se cierra", str(datetime.today().year))
+                st.warning(
+                    f"Se respaldarán {', '.join(LIBROS)} en archivos comprimidos y se vaciarán las hojas. "
+                    "Cada H:. conserva su saldo como 'Saldo inicial' y la Caja su saldo de apertura."
+                )
+                confirma = st.text_input(f"Escriba CERRAR {ciclo} para confirmar")
+                if st.button("1) Respaldar ciclo"):
+                    if confirma.strip() != f"CERRAR {ciclo}":
+                        st.error("Requiere confirmación manual (función protegida).")
+                    else:
+                        barra = st.progress(0.0, "Respaldando...")
+                        def avance(i, nombre, filas):
+                            barra.progress((i + 1) / len(LIBROS), f"{nombre}: {filas} filas respaldadas")
+                        try:
+                            st.session_state['cierre'] = respaldar_ciclo(sh, ciclo, progreso=avance)
+                            st.session_state['cierre_descargado'] = False
+                            barra.progress(1.0, "Respaldo listo.")
+                        except Exception as e:
+                            st.error(f"Error en el respaldo: {e}")
+
+                # El disco del servidor no es permanente: las hojas solo se
+                # vacían después de descargar el respaldo
+                respaldo = st.session_state.get('cierre')
+                if respaldo and respaldo["ciclo"] == ciclo:
+                    for nombre, (ruta, filas) in respaldo["archivos"].items():
+                        st.write(f"**{nombre}:** {filas} filas → `{ruta}`")
+                    def marcar_descarga():
+                        st.session_state['cierre_descargado'] = True
+                    st.download_button(f"⬇️ Descargar respaldo {ciclo} (ZIP)", data=lambda: zip_de_ciclo(ciclo),
+                                       file_name=f"cierre_{ciclo}.zip", mime="application/zip", on_click=marcar_descarga)
+                    descargado = st.session_state.get('cierre_descargado', False)
+                    if not descargado:
+                        st.info("Descargue el respaldo y guárdelo fuera del servidor para habilitar el paso 2.")
+                    if st.button("2) Vaciar hojas (Aplicar Cierre)", disabled=not descargado):
+                        try:
+                            res = aplicar_cierre(sh, respaldo)
+                            st.session_state.pop('cierre')
+                            st.success(f"✅ Ciclo {ciclo} cerrado. Saldos arrastrados: {res['arrastre']} HH:. | Caja inicial: ${res['caja']:,.2f}")
+                        except Exception as e:
+                            st.error(f"Error en el cierre: {e}")
+            
+            with t_hist:
+                ciclos = ciclos_archivados()
+                if ciclos:
+                    c_sel = st.selectbox("Ciclo", ciclos)
+                    libro = st.selectbox("Libro", LIBROS)
+                    try:
+                        st.dataframe(leer_archivo(libro, c_sel), use_container_width=True, hide_index=True)
+                    except FileNotFoundError:
+                        st.info("Ese libro no está en el archivo de este ciclo.")
+                    for ruta in archivos_de_ciclo(c_sel):
+                        with open(ruta, "rb") as f:
+                            st.download_button(f"⬇️ {os.path.basename(ruta)}", f, file_name=os.path.basename(ruta), key=ruta)
+                else:
+                    st.info("Aún no hay ciclos archivados.")
+            
+            with t_saldos:
+                st.caption("Tabla SALDOS: un renglón por H:. que se actualiza con cada cargo o abono.")
+                b1, b2 = st.columns(2)
+                if b1.button("🔍 Verificar consistencia", use_container_width=True):
+                    difs = verificar_saldos(sh)
+                    if difs is None:
+                        st.warning("La hoja SALDOS aún no existe. Use 'Reconstruir'.")
+                    elif difs.empty:
+                        st.success("SALDOS coincide con TESORERIA.")
+                    else:
+                        st.error(f"{len(difs)} HH:. con diferencias.")
+                        st.dataframe(difs, use_container_width=True, hide_index=True)
+                if b2.button("♻️ Reconstruir desde TESORERIA", use_container_width=True):
+                    try:
+                        st.success(f"SALDOS reconstruida: {reconstruir_saldos(sh)} HH:.")
+                    except Exception as e:
+                        st.error(f"Error al reconstruir: {e}")
+
+        # ---------------------------------------------------------
+        # 8. DIAGNÓSTICO (TIEMPOS, LLAMADAS A LA API Y CUOTA)
+        # ---------------------------------------------------------
+        elif menu == "ADMIN: Diagnóstico":
+            import pandas as pd
+            from metricas import obtener_registro, cuotas, percentiles, llamadas_por_minuto, uso_por_logia
+            st.header("🩺 Diagnóstico de Rendimiento")
+            registro = obtener_registro()
+            ev = registro.tabla()
+            if ev.empty:
+                st.info("Aún no hay mediciones en este proceso.")
+            else:
+                lect_max, escr_max = cuotas()
+                por_min = llamadas_por_minuto(ev)
+                ultimo = por_min.iloc[-1]
+                api = ev[ev['tipo'] == 'api']
+                cache = ev[ev['tipo'] == 'cache']
+                k1, k2, k3, k4 = st.columns(4)
+                k1.metric("Lecturas (último min)", int(ultimo['Lecturas']), f"cuota {lect_max}/min", delta_color="off")
+                k2.metric("Escrituras (último min)", int(ultimo['Escrituras']), f"cuota {escr_max}/min", delta_color="off")
+                k3.metric("Aciertos de caché", f"{(cache['op'] == 'hit').mean() * 100:.0f}%" if not cache.empty else "-")
+                k4.metric("Errores de API", int(api['error'].notna().sum()) if 'error' in api else 0)
+                
+                st.subheader("Llamadas a la API por minuto")
+                por_min['Cuota lecturas'] = lect_max
+                st.line_chart(por_min)
+                
+                if len(logias()) > 1:
+                    # La cuota es de la cuenta de servicio: se reparte entre logias
+                    st.subheader("Uso de la cuota por logia (últimos 5 min)")
+                    st.dataframe(uso_por_logia(ev), use_container_width=True)
+                
+                st.subheader("Latencia por vista (rerun completo)")
+                st.dataframe(percentiles(ev[ev['tipo'] == 'vista'], 'vista'), use_container_width=True, hide_index=True)
+                
+                c1, c2 = st.columns(2)
+                with c1:
+                    st.subheader("API por operación")
+                    st.dataframe(percentiles(api, 'op'), use_container_width=True, hide_index=True)
+                with c2:
+                    st.subheader("Pasos de pandas")
+                    st.dataframe(percentiles(ev[ev['tipo'] == 'pandas'], 'op'), use_container_width=True, hide_index=True)
+                
+                st.subheader("Operaciones más lentas (recientes)")
+                lentas = ev[ev['tipo'] != 'cache'].nlargest(20, 'ms').copy()
+                lentas['hora'] = pd.to_datetime(lentas['t'], unit='s', utc=True).dt.tz_convert(datetime.now().astimezone().tzinfo).dt.strftime("%H:%M:%S")
+                cols_l = [c for c in ['hora', 'vista', 'tipo', 'op', 'detalle', 'ms', 'filas', 'bytes'] if c in lentas.columns]
+                st.dataframe(lentas[cols_l], use_container_width=True, hide_index=True)
+                
+                if st.button("Borrar mediciones"):
+                    registro.limpiar()
+                    st.rerun()
 
 if __name__ == '__main__':
-    main()
+    if st.session_state.get('logged_in'):
+        from metricas import medir_rerun
+        with medir_rerun():
+            main()
+    else:
+        main()  # el login no se mide: medirlo cargaría pandas (metricas.py)
+
 
 
 
@@ -0,0 +1,276 @@
+import argparse
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import streamlit as st
+
+from almacen import ENCABEZADOS, LibroMemoria
+from app import COLS_ALTA, COLS_LISTA, make_hash
+from caja import mayor_de_caja
+from calculos import estado_de_cuenta, resumen_asistencia, resumen_deuda, MONTO_CAPITA
+from datos import buscar_usuario, en_paralelo, leer_columnas, leer_expediente, leer_hoja, movimientos
+from estados import generar_estados
+from saldos import reconstruir_saldos, saldo_de
+
+# ==========================================
+# BENCHMARK DE LAS RUTAS DE DATOS
+# ==========================================
+# Genera logias sintéticas en un LibroMemoria y mide, por tamaño, el tiempo
+# en frío (cachés vacías) y en caliente, la memoria pico y las llamadas a la
+# "API" de cada vista. Uso:
+#   python bench.py --miembros 50 500 5000 50000 --anios 3 --latencia 150
+#   python bench.py --miembros 300 --guardar logia.json   (para almacen_ruta)
+#   python bench.py --miembros 500 --arranque 3            (arranque en frío de app.py)
+TAMANOS = [50, 500, 5000, 50000]
+ROLES_OFICIALES = ["Venerable Maestro", "Secretario", "Tesorero", "Hospitalario", "Primer Vigilante", "Segundo Vigilante"]
+ESTADOS = ["Presente", "Presente", "Presente", "Retardo", "Falta", "Justif."]
+GASTOS = ["Operativo", "GL", "Evento"]
+CLAVE = "clave"
+
+
+def generar_logia(miembros, anios=2, semilla=0):
+    rnd = random.Random(semilla)
+    ancho = len(ENCABEZADOS["DIRECTORIO"])
+    clave = make_hash(CLAVE)
+    directorio, grados = [], {}
+    for i in range(1, miembros + 1):
+        rol = ROLES_OFICIALES[i - 1] if i <= len(ROLES_OFICIALES) else "Miembro"
+        grados[i] = rnd.choice([1, 2, 3, 3])
+        estatus = "Activo" if rnd.random() < 0.85 else "Baja"
+        fila = [i, f"Hermano {i}", f"h{i}", clave, "FALSE", rol, grados[i], estatus]
+        directorio.append(fila + [""] * (ancho - len(fila)))
+    activos = [f[0] for f in directorio if f[7] == "Activo"]
+
+    tesoreria, asistencias, caja = [], [], []
+    for a in range(anios):
+        for mes in range(1, 13):
+            anio = 2020 + a
+            cobrado = 0
+            for id_h in activos:
+                tesoreria.append([f"01/{mes:02d}/{anio}", id_h, f"Cápita {mes}/{anio}", "Cargo", MONTO_CAPITA])
+                if rnd.random() < 0.8:
+                    monto = rnd.choice([MONTO_CAPITA, MONTO_CAPITA, 200, 900])
+                    tesoreria.append([f"{rnd.randint(2, 28):02d}/{mes:02d}/{anio}", id_h, "Abono", "Abono", monto])
+                    cobrado += monto
+            # Dos tenidas al mes; asisten los de grado suficiente
+            for dia, grado in ((7, 1), (21, rnd.choice([1, 2, 3]))):
+                fecha = f"{dia:02d}/{mes:02d}/{anio}"
+                asistencias.extend(
+                    [fecha, grado, id_h, rnd.choice(ESTADOS), ""] for id_h in activos if grados[id_h] >= grado
+                )
+            caja.append([f"28/{mes:02d}/{anio}", f"Cápitas {mes}/{anio}", "Ingreso", cobrado, 0, ""])
+            for _ in range(rnd.randint(3, 8)):
+                caja.append([f"{rnd.randint(1, 28):02d}/{mes:02d}/{anio}", "Gasto", rnd.choice(GASTOS),
+                             0, round(rnd.uniform(100, 3000) * max(miembros / 50, 1), 2), ""])
+
+    hojas = {
+        "DIRECTORIO": [ENCABEZADOS["DIRECTORIO"]] + directorio,
+        "TESORERIA": [ENCABEZADOS["TESORERIA"]] + tesoreria,
+        "ASISTENCIAS": [ENCABEZADOS["ASISTENCIAS"]] + asistencias,
+        "LIBRO_CAJA": [ENCABEZADOS["LIBRO_CAJA"]] + caja,
+    }
+    return hojas
+
+
+# --- Rutas de datos de cada vista (lo mismo que hace app.py) ---
+def ruta_login(sh, id_h):
+    return buscar_usuario(sh, f"h{id_h}")
+
+
+def ruta_mi_tablero(sh, id_h):
+    datos = en_paralelo(sh, {
+        "asis": lambda: movimientos(sh, ["ASISTENCIAS"], id_h)["ASISTENCIAS"],
+        "saldo": lambda: saldo_de(sh, id_h),
+    })
+    return datos, estado_de_cuenta(movimientos(sh, ["TESORERIA"], id_h)["TESORERIA"])
+
+
+def ruta_reporte_secretaria(sh, id_h):
+    datos = en_paralelo(sh, {
+        "hh": lambda: leer_columnas(sh, "DIRECTORIO", COLS_LISTA),
+        "as": lambda: leer_hoja(sh, "ASISTENCIAS"),
+    })
+    return resumen_asistencia(datos["as"], datos["hh"])
+
+
+def ruta_capitas_global(sh, id_h):
+    datos = en_paralelo(sh, {
+        "tes": lambda: leer_hoja(sh, "TESORERIA"),
+        "dir": lambda: leer_columnas(sh, "DIRECTORIO", COLS_LISTA),
+    })
+    return resumen_deuda(datos["tes"], datos["dir"])
+
+
+def ruta_editar_expediente(sh, id_h):
+    return leer_columnas(sh, "DIRECTORIO", COLS_ALTA), leer_expediente(sh, id_h)
+
+
+def ruta_estados(sh, id_h):
+    datos = en_paralelo(sh, {
+        "tes": lambda: leer_hoja(sh, "TESORERIA"),
+        "as": lambda: leer_hoja(sh, "ASISTENCIAS"),
+        "dir": lambda: leer_columnas(sh, "DIRECTORIO", COLS_LISTA),
+    })
+    with tempfile.TemporaryFile() as destino:
+        return generar_estados(datos["tes"], datos["as"], datos["dir"], destino)
+
+
+def ruta_balance(sh, id_h):
+    return mayor_de_caja(sh, leer_hoja(sh, "LIBRO_CAJA")).flujo_mensual()
+
+
+RUTAS = {
+    "Login": ruta_login,
+    "Mi Tablero": ruta_mi_tablero,
+    "Secretaría (reporte)": ruta_reporte_secretaria,
+    "Cápitas Global": ruta_capitas_global,
+    "Editar expediente": ruta_editar_expediente,
+    "Balance": ruta_balance,
+    "Estados (ZIP)": ruta_estados,
+}
+
+
+def _medir(sh, ruta, id_h):
+    llamadas = sh.llamadas
+    inicio = time.perf_counter()
+    ruta(sh, id_h)
+    return (time.perf_counter() - inicio) * 1000, sh.llamadas - llamadas
+
+
+def medir_ruta(sh, ruta, id_h):
+    st.cache_resource.clear()
+    frio, llamadas = _medir(sh, ruta, id_h)
+    caliente, _ = _medir(sh, ruta, id_h)
+    # Memoria en una corrida aparte: tracemalloc altera los tiempos
+    st.cache_resource.clear()
+    tracemalloc.start()
+    ruta(sh, id_h)
+    pico = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+    return {"frio_ms": frio, "caliente_ms": caliente, "pico_mb": pico, "llamadas": llamadas}
+
+
+def correr(tamanos, anios, latencia, semilla=0):
+    resultados = []
+    for miembros in tamanos:
+        hojas = generar_logia(miembros, anios, semilla)
+        filas = {n: len(f) - 1 for n, f in hojas.items()}
+        sh = LibroMemoria(hojas, latencia=latencia)
+        st.cache_resource.clear()
+        reconstruir_saldos(sh)
+        id_h = miembros // 2 + 1
+        print(f"\n== {miembros} HH:. | " + ", ".join(f"{n}: {c:,}" for n, c in filas.items()))
+        print(f"{'Vista':<22}{'frío ms':>10}{'caliente ms':>13}{'pico MB':>10}{'llamadas':>10}")
+        for nombre, ruta in RUTAS.items():
+            r = medir_ruta(sh, ruta, id_h)
+            print(f"{nombre:<22}{r['frio_ms']:>10.1f}{r['caliente_ms']:>13.1f}{r['pico_mb']:>10.1f}{r['llamadas']:>10}")
+            resultados.append({"miembros": miembros, "filas": filas, "vista": nombre, **r})
+    return resultados
+
+
+# --- Arranque en frío: cada corrida en un proceso nuevo ---
+# Se mide por separado importar app.py (y qué módulos pesados trae) y, con
+# AppTest, pintar el login, tener el libro abierto por el hilo de arranque
+# y entrar. La copia local de credenciales se crea en la primera corrida,
+# así que las siguientes entran con ella.
+PESADOS = ["pandas", "gspread", "datos"]
+
+SCRIPT_IMPORTAR = """
+import json, sys, time
+inicio = time.perf_counter()
+import app
+print(json.dumps({"importar_ms": (time.perf_counter() - inicio) * 1000,
+                  "pesados": [m for m in %r if m in sys.modules]}))
+""" % PESADOS
+
+SCRIPT_LOGIN = """
+import json, logging, os, sys, time
+logging.disable(logging.WARNING)
+from streamlit.testing.v1 import AppTest
+ruta, latencia, credenciales, clave = sys.argv[1], float(sys.argv[2]), sys.argv[3], sys.argv[4]
+copia = os.path.exists(credenciales)
+at = AppTest.from_file("app.py", default_timeout=300)
+at.secrets["almacen"] = "memoria"
+at.secrets["almacen_ruta"] = ruta
+at.secrets["almacen_latencia_ms"] = latencia
+at.secrets["credenciales_locales"] = credenciales
+inicio = time.perf_counter()
+at.run()
+login = time.perf_counter() - inicio
+from acceso import connect_db
+connect_db()
+listo = time.perf_counter() - inicio
+at.text_input[0].input("h1")
+at.text_input[1].input(clave)
+entrar = time.perf_counter()
+at.button[0].click().run()
+dentro = time.perf_counter() - entrar
+errores = [str(e.value) for e in list(at.exception) + list(at.error)]
+print(json.dumps({"copia": copia, "login_ms": login * 1000, "libro_ms": listo * 1000,
+                  "entrar_ms": dentro * 1000, "errores": errores}))
+"""
+
+
+def _subproceso(script, *argumentos):
+    salida = subprocess.run([sys.executable, "-c", script, *argumentos], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout
+    return json.loads(salida.strip().splitlines()[-1])
+
+
+def correr_arranque(miembros, anios, latencia_ms, repeticiones, semilla=0):
+    resultados = []
+    with tempfile.TemporaryDirectory() as carpeta:
+        ruta = os.path.join(carpeta, "logia.json")
+        credenciales = os.path.join(carpeta, "credenciales.json")
+        with open(ruta, "w", encoding="utf-8") as f:
+            json.dump(generar_logia(miembros, anios, semilla), f, ensure_ascii=False)
+        print(f"\n== Arranque en frío | {miembros} HH:. | latencia {latencia_ms:g} ms")
+        print(f"{'Corrida':<9}{'import ms':>11}{'pesados':>20}{'login ms':>10}{'libro ms':>10}{'entrar ms':>11}{'copia':>7}")
+        for i in range(1, repeticiones + 1):
+            r = {**_subproceso(SCRIPT_IMPORTAR),
+                 **_subproceso(SCRIPT_LOGIN, ruta, str(latencia_ms), credenciales, CLAVE)}
+            for e in r["errores"]:
+                print(f"  ! {e}")
+            print(f"{i:<9}{r['importar_ms']:>11.1f}{','.join(r['pesados']) or '-':>20}{r['login_ms']:>10.1f}"
+                  f"{r['libro_ms']:>10.1f}{r['entrar_ms']:>11.1f}{'sí' if r['copia'] else 'no':>7}")
+            resultados.append({"miembros": miembros, "corrida": i, **r})
+    return resultados
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark de las rutas de datos con logias sintéticas")
+    p.add_argument("--miembros", type=int, nargs="+", default=TAMANOS)
+    p.add_argument("--anios", type=int, default=2, help="años de ASISTENCIAS y TESORERIA")
+    p.add_argument("--latencia", type=float, default=0, help="ms por llamada a la API simulada")
+    p.add_argument("--semilla", type=int, default=0)
+    p.add_argument("--json", help="guardar los resultados en este archivo")
+    p.add_argument("--guardar", help="solo generar la logia (primer tamaño) en este JSON para la app")
+    p.add_argument("--arranque", type=int, metavar="N", help="solo medir N arranques en frío de app.py (primer tamaño)")
+    args = p.parse_args()
+
+    # Fuera de `streamlit run` las cachés avisan en cada llamada
+    logging.disable(logging.WARNING)
+    if args.guardar:
+        hojas = generar_logia(args.miembros[0], args.anios, args.semilla)
+        with open(args.guardar, "w", encoding="utf-8") as f:
+            json.dump(hojas, f, ensure_ascii=False)
+        print(f"Logia de {args.miembros[0]} HH:. guardada en {args.guardar} (usuarios h1..h{args.miembros[0]}, clave '{CLAVE}')")
+        return
+    if args.arranque:
+        resultados = correr_arranque(args.miembros[0], args.anios, args.latencia, args.arranque, args.semilla)
+    else:
+        resultados = correr(args.miembros, args.anios, args.latencia / 1000, args.semilla)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import threading
+import time
+
+import pandas as pd
+import streamlit as st
+
+from datos import leer_hoja
+
+# ==========================================
+# 1. MAYOR DE CAJA (CORTES MENSUALES)
+# ==========================================
+# Entradas y salidas de LIBRO_CAJA acumuladas por mes y categoría. Cada
+# rerun solo suma las filas nuevas desde el último corte; si la hoja se
+# acortó (cierre de ciclo) o la fila del corte ya no es la misma, se
+# recalcula todo. Como red de seguridad ante ediciones manuales de filas
+# viejas, también se recalcula completo cada REVISION_COMPLETA segundos.
+# La categoría es la tercera columna (Operativo/GL/Evento/Ingreso...).
+SIN_FECHA = "Sin fecha"
+REVISION_COMPLETA = 3600
+
+
+def _agregar(df):
+    # Suma de un tramo de filas por (Mes, Categoria)
+    tramo = pd.DataFrame({
+        'Mes': df['Fecha'].dt.strftime("%Y-%m").fillna(SIN_FECHA),
+        'Categoria': df.iloc[:, 2].astype(str).replace("", "Sin categoría"),
+        'Entrada': df['Entrada'].fillna(0),
+        'Salida': df['Salida'].fillna(0),
+    })
+    return tramo.groupby(['Mes', 'Categoria']).sum()
+
+
+def _fila(df, i):
+    # Fila comparable entre cargas (NaN/NaT no son iguales a sí mismos)
+    return tuple(None if pd.isna(v) else v for v in df.iloc[i].tolist())
+
+
+class MayorCaja:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self._meses = pd.DataFrame(
+            columns=['Entrada', 'Salida'], dtype=float,
+            index=pd.MultiIndex.from_tuples([], names=['Mes', 'Categoria']),
+        )
+        self._filas = 0
+        self._corte = None
+        self._completo = time.time()
+
+    def actualizar(self, df):
+        with self._lock:
+            n = self._filas
+            if (
+                n > len(df)
+                or (n and _fila(df, n - 1) != self._corte)
+                or time.time() - self._completo > REVISION_COMPLETA
+            ):
+                self._reiniciar()
+                n = 0
+            nuevas = df.iloc[n:]
+            if not nuevas.empty:
+                self._meses = self._meses.add(_agregar(nuevas), fill_value=0)
+            self._filas = len(df)
+            self._corte = _fila(df, len(df) - 1) if len(df) else None
+        return self
+
+    def saldo(self):
+        return float(self._meses['Entrada'].sum() - self._meses['Salida'].sum())
+
+    def flujo_mensual(self):
+        # Un renglón por mes: saldo de apertura, entradas, salidas y cierre
+        meses = self._meses.groupby(level='Mes').sum()
+        meses['Cierre'] = (meses['Entrada'] - meses['Salida']).cumsum()
+        meses['Apertura'] = meses['Cierre'] - meses['Entrada'] + meses['Salida']
+        return meses[['Apertura', 'Entrada', 'Salida', 'Cierre']]
+
+    def por_categoria(self, columna='Salida'):
+        # Mes x Categoría de las entradas o de las salidas
+        tabla = self._meses[columna].unstack('Categoria', fill_value=0)
+        tabla.columns.name = None
+        return tabla.loc[:, (tabla != 0).any()]
+
+
+@st.cache_resource
+def _mayores(id_libro):
+    return MayorCaja()
+
+
+def mayor_de_caja(sh, df=None):
+    # Usa la misma copia de LIBRO_CAJA que la vista (sin lecturas extra)
+    if df is None:
+        df = leer_hoja(sh, "LIBRO_CAJA")
+    return _mayores(sh.id).actualizar(df)
@@ -0,0 +1,136 @@
+import pandas as pd
+
+# Los DataFrames llegan tipados por esquema.py (ID_H entero, Monto float,
+# fechas como datetime, Tipo/Estado/Estatus como categorías).
+
+# ==========================================
+# 1. ESTADO DE CUENTA (APLICACIÓN FIFO DE PAGOS)
+# ==========================================
+# Los abonos de cada H:. se aplican a sus cargos en el orden de la hoja:
+# se cubren completos mientras alcance el dinero, el siguiente queda
+# "Parcial" y el resto "Adeudo". Un cargo negativo (corrección a mano en la
+# hoja) devuelve dinero para los cargos que siguen. Lo disponible antes de
+# cada cargo es D = max(D_anterior - cargo, 0) partiendo del total abonado;
+# en lugar de recorrer los cargos, sale de sumas acumuladas por ID_H:
+# D = S - min(0, mínimo de S en los cargos anteriores), con S = abonado
+# menos los cargos anteriores. Montos vacíos cuentan como 0 y un total
+# abonado negativo (devoluciones) se toma como 0.
+def estado_de_cuenta(tes):
+    montos = tes['Monto'].fillna(0)
+    pagado = montos[tes['Tipo'] == 'Abono'].groupby(tes['ID_H']).sum().clip(lower=0)
+
+    es_cargo = tes['Tipo'] == 'Cargo'
+    cargos = tes.loc[es_cargo, ['ID_H', 'Fecha', 'Concepto']].copy()
+    deuda = montos[es_cargo]
+    grupos = cargos['ID_H']
+    despues = cargos['ID_H'].map(pagado).fillna(0) - deuda.groupby(grupos).cumsum()
+    antes = despues + deuda
+    minimo = despues.groupby(grupos).cummin().groupby(grupos).shift(1).fillna(0).clip(upper=0)
+    dinero = antes - minimo
+
+    cargos['Estatus'] = 'Adeudo'
+    cargos.loc[dinero > 0, 'Estatus'] = 'Parcial'
+    cargos.loc[dinero >= deuda, 'Estatus'] = 'Pagado'
+    cargos['Falta'] = (deuda - dinero).where(dinero < deuda, 0)
+    return cargos
+
+
+# ==========================================
+# 2. ASISTENCIA (UNA SOLA PASADA PARA TODO EL TALLER)
+# ==========================================
+POSITIVOS_REPORTE = ['Presente', 'Retardo']
+SEMAFORO_VERDE = 80.0
+SEMAFORO_AMARILLO = 60.0
+ESTADOS_ASISTENCIA = ["Presente", "Falta", "Justif.", "Retardo"]
+
+
+def resumen_asistencia(asis, directorio, positivos=POSITIVOS_REPORTE, desde=None, hasta=None, grado=None):
+    # Una fila por H:. activo con sus tenidas, asistencias y porcentaje.
+    # `directorio` solo necesita ID_H, Nombre_Completo, Grado_Actual y Estatus.
+    miembros = directorio[directorio['Estatus'] == 'Activo']
+    if grado is not None:
+        miembros = miembros[miembros['Grado_Actual'] == grado]
+
+    regs = asis
+    if desde is not None or hasta is not None:
+        en_rango = pd.Series(True, index=asis.index)
+        if desde is not None:
+            en_rango &= asis['Fecha_Tenida'] >= pd.Timestamp(desde)
+        if hasta is not None:
+            en_rango &= asis['Fecha_Tenida'] <= pd.Timestamp(hasta)
+        regs = asis[en_rango]
+
+    conteo = pd.DataFrame({
+        'ID_H': regs['ID_H'],
+        'Positiva': regs['Estado'].isin(positivos),
+    }).groupby('ID_H').agg(Tenidas=('Positiva', 'size'), Asistencias=('Positiva', 'sum'))
+
+    res = pd.DataFrame({
+        'ID_H': miembros['ID_H'],
+        'Nombre': miembros['Nombre_Completo'],
+        'Grado': miembros['Grado_Actual'],
+    }).merge(conteo, left_on='ID_H', right_index=True, how='left')
+    res[['Tenidas', 'Asistencias']] = res[['Tenidas', 'Asistencias']].fillna(0).astype(int)
+    res['% Asist'] = (res['Asistencias'] / res['Tenidas'] * 100).where(res['Tenidas'] > 0, 0.0)
+    return res.reset_index(drop=True)
+
+
+def lista_de_tenida(asis, directorio, fecha, grado):
+    # Convocados (grado suficiente) que aún no tienen registro de esa tenida
+    # (misma Fecha_Tenida y Grado) y cuántos ya lo tienen. Estado inicia en
+    # "Presente"; así volver a guardar no duplica filas en ASISTENCIAS.
+    registrados = set()
+    if not asis.empty:
+        de_tenida = (asis['Fecha_Tenida'] == pd.Timestamp(fecha)) & (asis['Grado'] == grado)
+        registrados = set(asis.loc[de_tenida, 'ID_H'].dropna())
+    convocados = directorio[directorio['Grado_Actual'] >= grado]
+    faltan = convocados[~convocados['ID_H'].isin(registrados)]
+    lista = pd.DataFrame({
+        'ID_H': faltan['ID_H'],
+        'Nombre': faltan['Nombre_Completo'].astype(str),
+        'Estado': ESTADOS_ASISTENCIA[0],
+    }).reset_index(drop=True)
+    return lista, len(convocados) - len(faltan)
+
+
+def semaforo(pct):
+    if pct >= SEMAFORO_VERDE:
+        return "🟢"
+    return "🟡" if pct >= SEMAFORO_AMARILLO else "🔴"
+
+
+# ==========================================
+# 3. SALDOS Y ANTIGÜEDAD DE ADEUDOS
+# ==========================================
+MONTO_CAPITA = 450.0
+TRAMOS_ADEUDO = ["Al corriente", "0-3 meses", "3-6 meses", "6+ meses"]
+
+
+def saldos_por_hermano(tes):
+    # Pivote ID_H x Tipo de los montos: columnas Cargo, Abono y Saldo
+    tabla = pd.DataFrame({
+        'ID_H': tes['ID_H'],
+        'Tipo': tes['Tipo'],
+        'Monto': tes['Monto'].fillna(0),
+    }).pivot_table(index='ID_H', columns='Tipo', values='Monto', aggfunc='sum', fill_value=0)
+    tabla = tabla.reindex(columns=['Cargo', 'Abono'], fill_value=0).astype(float)
+    tabla.columns.name = None
+    tabla['Saldo'] = tabla['Cargo'] - tabla['Abono']
+    return tabla
+
+
+def resumen_deuda(tes, directorio, monto_capita=MONTO_CAPITA):
+    # Saldo de cada H:. con nombre, grado y estatus, y su tramo de antigüedad
+    # medido en cápitas adeudadas. `directorio` solo necesita ID_H,
+    # Nombre_Completo, Grado_Actual y Estatus.
+    res = pd.DataFrame({
+        'ID_H': directorio['ID_H'],
+        'Nombre': directorio['Nombre_Completo'],
+        'Grado': directorio['Grado_Actual'],
+        'Estatus': directorio['Estatus'],
+    }).merge(saldos_por_hermano(tes), left_on='ID_H', right_index=True, how='outer')
+    res['Nombre'] = res['Nombre'].fillna("(sin expediente)")
+    res[['Cargo', 'Abono', 'Saldo']] = res[['Cargo', 'Abono', 'Saldo']].fillna(0)
+    res['Cápitas'] = res['Saldo'] / monto_capita
+    res['Antigüedad'] = pd.cut(res['Cápitas'], bins=[float('-inf'), 0, 3, 6, float('inf')], labels=TRAMOS_ADEUDO)
+    return res.reset_index(drop=True)
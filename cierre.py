@@ -0,0 +1,286 @@
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import zipfile
+from datetime import datetime
+
+import pandas as pd
+from gspread.utils import rowcol_to_a1
+
+from configuracion import secreto
+from esquema import fechas, tipar_hoja
+from datos import hoja, existe_hoja, con_reintentos, LoteEscritura
+from saldos import HOJA_SALDOS, reconstruir_saldos
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # sin pyarrow se archiva en CSV comprimido
+    pa = pq = None
+
+# ==========================================
+# 1. CONFIGURACIÓN DEL ARCHIVO HISTÓRICO
+# ==========================================
+LIBROS = ["TESORERIA", "ASISTENCIAS", "LIBRO_CAJA"]
+FILAS_POR_BLOQUE = 2000
+COLUMNAS_NUMERICAS = ["ID_H", "Monto", "Entrada", "Salida", "Grado"]
+COLUMNAS_FECHA = ["Fecha", "Fecha_Tenida"]
+EXTENSIONES = (".parquet", ".csv.gz")
+# La etiqueta va en el nombre del archivo ("2026_TESORERIA.parquet"): sin
+# "_" (separa ciclo y libro) ni separadores de ruta
+CICLO_VALIDO = re.compile(r"[A-Za-z0-9-]{1,40}")
+EN_CURSO = ".en_curso"  # subcarpeta de los respaldos aún sin verificar
+
+
+def dir_archivo():
+    ruta = secreto("dir_archivo", "archivo")
+    os.makedirs(ruta, exist_ok=True)
+    return ruta
+
+
+def tipar(df):
+    # Tipos del archivo: números, fechas reales y el resto como texto
+    df = df.copy()
+    for col in df.columns:
+        if col in COLUMNAS_NUMERICAS:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(float)
+        elif col in COLUMNAS_FECHA:
+            df[col] = fechas(df[col])
+        else:
+            df[col] = df[col].astype(str)
+    return df
+
+
+# ==========================================
+# 2. LECTURA POR BLOQUES Y ESCRITURA DEL ARCHIVO
+# ==========================================
+def _bloques(ws, encabezado, hasta=None):
+    # Devuelve (número de la última fila leída, filas) por bloques de
+    # FILAS_POR_BLOQUE, sin cargar la hoja completa en memoria. Las filas
+    # vacías se cuentan (para borrar exactamente lo leído) pero no se emiten.
+    ancho = len(encabezado)
+    letra = rowcol_to_a1(1, ancho)[:-1]
+    inicio = 2
+    while hasta is None or inicio <= hasta:
+        fin = inicio + FILAS_POR_BLOQUE - 1
+        if hasta is not None:
+            fin = min(fin, hasta)
+        valores = con_reintentos(lambda: ws.get(f"A{inicio}:{letra}{fin}"))
+        if not valores:
+            return
+        filas = [(f + [""] * ancho)[:ancho] for f in valores]
+        yield inicio + len(filas) - 1, [f for f in filas if any(v != "" for v in f)]
+        inicio = fin + 1
+
+
+class _EscritorArchivo:
+    # Escribe en EN_CURSO y solo se publica (con su nombre final) cuando el
+    # conteo de filas coincide; nunca escribe encima de un archivo existente
+    def __init__(self, ruta_base, encabezado):
+        self.encabezado = encabezado
+        self.ruta = ruta_base + (".parquet" if pq else ".csv.gz")
+        carpeta, archivo = os.path.split(self.ruta)
+        os.makedirs(os.path.join(carpeta, EN_CURSO), exist_ok=True)
+        self.temporal = os.path.join(carpeta, EN_CURSO, archivo)
+        self._parquet = None
+        self._csv = None
+        self.filas = 0
+
+    def escribir(self, filas):
+        if not filas:
+            return
+        df = pd.DataFrame(filas, columns=self.encabezado)
+        if pq:
+            tabla = pa.Table.from_pandas(tipar(df), preserve_index=False)
+            if self._parquet is None:
+                self._parquet = pq.ParquetWriter(self.temporal, tabla.schema, compression="zstd")
+            self._parquet.write_table(tabla.cast(self._parquet.schema))
+        else:
+            if self._csv is None:
+                self._archivo = gzip.open(self.temporal, "wt", newline="", encoding="utf-8")
+                self._csv = csv.writer(self._archivo)
+                self._csv.writerow(self.encabezado)
+            self._csv.writerows(filas)
+        self.filas += len(filas)
+
+    def cerrar(self):
+        if self._parquet is not None:
+            self._parquet.close()
+        elif self._csv is not None:
+            self._archivo.close()
+        elif pq:
+            # Hoja sin movimientos: archivo vacío con el encabezado
+            pq.write_table(pa.Table.from_pandas(pd.DataFrame(columns=self.encabezado).astype(str)), self.temporal)
+        else:
+            with gzip.open(self.temporal, "wt", newline="", encoding="utf-8") as f:
+                csv.writer(f).writerow(self.encabezado)
+
+    def publicar(self):
+        # link falla si el destino ya existe (rename lo reemplazaría)
+        try:
+            os.link(self.temporal, self.ruta)
+        except FileExistsError:
+            raise RuntimeError(f"{self.ruta} ya existe; no se borró nada.")
+        os.remove(self.temporal)
+
+
+def _huella(huella, filas):
+    for fila in filas:
+        huella.update(json.dumps(fila, ensure_ascii=False).encode("utf-8"))
+
+
+def _acumular_saldos(saldos, filas, encabezado):
+    df = tipar_hoja("TESORERIA", pd.DataFrame(filas, columns=encabezado))
+    signo = df['Tipo'].map({'Cargo': 1, 'Abono': -1}).astype(float).fillna(0)
+    for id_h, saldo in (df['Monto'].fillna(0) * signo).groupby(df['ID_H']).sum().items():
+        saldos[int(id_h)] = saldos.get(int(id_h), 0.0) + saldo
+
+
+def _acumular_caja(total, filas, encabezado):
+    df = tipar_hoja("LIBRO_CAJA", pd.DataFrame(filas, columns=encabezado))
+    return total + df['Entrada'].sum() - df['Salida'].sum()
+
+
+# ==========================================
+# 3. CIERRE DE CICLO
+# ==========================================
+# En dos pasos, porque el disco del servidor puede no durar (un redespliegue
+# lo borra) y las filas borradas solo quedan en el archivo:
+# 1) respaldar_ciclo: respalda cada libro por bloques y calcula saldos al
+#    cierre. No toca las hojas; el respaldo queda "pendiente".
+# 2) aplicar_cierre: solo después de descargar el ZIP del respaldo. Comprueba
+#    que las filas respaldadas no cambiaron y, en UN lote, agrega saldos
+#    iniciales y borra esas filas. Las que llegaron después no se borran.
+# Un ciclo con archivos y sin marca de pendiente ya se cerró (o se está
+# cerrando): no se vuelve a respaldar, su archivo es la única copia.
+def _pendiente(ciclo):
+    return os.path.join(dir_archivo(), f"{ciclo}.pendiente")
+
+
+def respaldar_ciclo(sh, ciclo, progreso=None):
+    if not CICLO_VALIDO.fullmatch(str(ciclo)):
+        raise ValueError("El ciclo solo puede llevar letras, números y guiones (sin '_').")
+    previos = archivos_de_ciclo(ciclo)
+    if previos and not os.path.exists(_pendiente(ciclo)):
+        raise ValueError(
+            f"El ciclo {ciclo} ya está archivado. Si el cierre quedó a medias, revise las hojas y "
+            f"mueva sus archivos fuera de '{dir_archivo()}' antes de repetirlo, o use otra etiqueta."
+        )
+    # Respaldo de un intento que nunca se aplicó: sus filas siguen en las hojas
+    for ruta in previos:
+        os.remove(ruta)
+    ruta_dir = dir_archivo()
+    saldos, caja = {}, 0.0
+    leidas, huellas, archivos, escritores = {}, {}, {}, []
+    for i, nombre in enumerate(LIBROS):
+        ws = hoja(sh, nombre)
+        encabezado = con_reintentos(lambda: ws.row_values(1))
+        escritor = _EscritorArchivo(os.path.join(ruta_dir, f"{ciclo}_{nombre}"), encabezado)
+        huella = hashlib.sha256()
+        ultima = 1
+        try:
+            for ultima, filas in _bloques(ws, encabezado):
+                escritor.escribir(filas)
+                _huella(huella, filas)
+                if nombre == "TESORERIA":
+                    _acumular_saldos(saldos, filas, encabezado)
+                elif nombre == "LIBRO_CAJA":
+                    caja = _acumular_caja(caja, filas, encabezado)
+                if progreso:
+                    progreso(i, nombre, escritor.filas)
+        finally:
+            escritor.cerrar()
+        leidas[nombre] = ultima
+        huellas[nombre] = huella.hexdigest()
+        archivos[nombre] = (escritor.ruta, escritor.filas)
+        if contar_filas(escritor.temporal) != escritor.filas:
+            raise RuntimeError(f"El respaldo de {nombre} no coincide; no se borró nada.")
+        escritores.append(escritor)
+    # Los tres respaldos verificados pasan a su nombre final
+    open(_pendiente(ciclo), "w").close()
+    for escritor in escritores:
+        escritor.publicar()
+
+    hoy = datetime.today().strftime("%d/%m/%Y")
+    concepto = f"Saldo inicial (cierre {ciclo})"
+    arrastre = [
+        [hoy, id_h, concepto, "Cargo" if saldo > 0 else "Abono", round(abs(saldo), 2)]
+        for id_h, saldo in sorted(saldos.items()) if round(saldo, 2) != 0
+    ]
+    apertura = [hoy, concepto, "Apertura", max(caja, 0), max(-caja, 0), ""]
+    return {"ciclo": ciclo, "archivos": archivos, "leidas": leidas, "huellas": huellas,
+            "arrastre": arrastre, "apertura": apertura, "caja": caja}
+
+
+def zip_de_ciclo(ciclo):
+    # Los archivos ya van comprimidos: el ZIP solo los junta
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_STORED) as zf:
+        for ruta in archivos_de_ciclo(ciclo):
+            zf.write(ruta, os.path.basename(ruta))
+    return buf.getvalue()
+
+
+def aplicar_cierre(sh, respaldo):
+    ciclo = respaldo["ciclo"]
+    if not os.path.exists(_pendiente(ciclo)) or len(archivos_de_ciclo(ciclo)) != len(LIBROS):
+        raise ValueError(f"El respaldo de {ciclo} ya se aplicó o ya no está en el servidor; respalde de nuevo.")
+    for nombre, ultima in respaldo["leidas"].items():
+        ws = hoja(sh, nombre)
+        encabezado = con_reintentos(lambda: ws.row_values(1))
+        huella = hashlib.sha256()
+        for _, filas in _bloques(ws, encabezado, hasta=ultima):
+            _huella(huella, filas)
+        if huella.hexdigest() != respaldo["huellas"][nombre]:
+            raise RuntimeError(f"{nombre} cambió desde el respaldo; respalde de nuevo. No se borró nada.")
+    # Sin marca de pendiente antes de borrar: si algo falla de aquí en
+    # adelante, el ciclo cuenta como cerrado y no se sobrescribe su archivo
+    os.remove(_pendiente(ciclo))
+    lote = LoteEscritura(sh)
+    if respaldo["arrastre"]:
+        lote.anexar("TESORERIA", respaldo["arrastre"])
+    lote.anexar("LIBRO_CAJA", [respaldo["apertura"]])
+    for nombre, ultima in respaldo["leidas"].items():
+        if ultima >= 2:
+            lote.eliminar_filas(nombre, 2, ultima)
+    lote.ejecutar()
+    # Los totales de Cargo/Abono cambiaron (el saldo no): se recalcula SALDOS
+    if existe_hoja(sh, HOJA_SALDOS):
+        reconstruir_saldos(sh)
+    return {"archivos": respaldo["archivos"], "arrastre": len(respaldo["arrastre"]), "caja": respaldo["caja"]}
+
+
+# ==========================================
+# 4. LECTURA DE CICLOS ARCHIVADOS
+# ==========================================
+def contar_filas(ruta):
+    if ruta.endswith(".parquet"):
+        return pq.ParquetFile(ruta).metadata.num_rows
+    with gzip.open(ruta, "rt", newline="", encoding="utf-8") as f:
+        return sum(1 for _ in csv.reader(f)) - 1
+
+
+def archivos_de_ciclo(ciclo):
+    ruta_dir = dir_archivo()
+    return sorted(
+        os.path.join(ruta_dir, f) for f in os.listdir(ruta_dir)
+        if f.startswith(f"{ciclo}_") and f.endswith(EXTENSIONES)
+    )
+
+
+def ciclos_archivados():
+    return sorted(
+        {f.split("_", 1)[0] for f in os.listdir(dir_archivo()) if f.endswith(EXTENSIONES)},
+        reverse=True,
+    )
+
+
+def leer_archivo(nombre, ciclo):
+    base = os.path.join(dir_archivo(), f"{ciclo}_{nombre}")
+    if os.path.exists(base + ".parquet"):
+        return pd.read_parquet(base + ".parquet")
+    return tipar(pd.read_csv(base + ".csv.gz", dtype=str, keep_default_na=False))
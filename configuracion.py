@@ -0,0 +1,14 @@
+import streamlit as st
+
+
+# ==========================================
+# 1. LECTURA DE SECRETS
+# ==========================================
+# Sin archivo de secrets (bench.py, scripts), sin la clave o con un valor que
+# no se puede convertir a `tipo`, se usa el valor por defecto.
+def secreto(clave, defecto=None, tipo=None):
+    try:
+        valor = st.secrets.get(clave, defecto)
+        return tipo(valor) if tipo is not None and valor is not None else valor
+    except Exception:
+        return defecto
@@ -0,0 +1 @@
+# Las pruebas importan los módulos del portal desde la raíz del repo
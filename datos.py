@@ -0,0 +1,821 @@
+import contextvars
+import itertools
+import numbers
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+import pandas as pd
+import streamlit as st
+from gspread.exceptions import APIError, WorksheetNotFound
+from gspread.utils import numericise_all, rowcol_to_a1
+
+from acceso import guardar_credenciales
+from configuracion import secreto
+from esquema import ESQUEMAS, FORMATO_FECHA, enteros, tipar_hoja
+from espejo import EspejoLocal
+from metricas import etiquetar_vista, medir, obtener_limitadores, obtener_registro, registrar_cache
+
+# ==========================================
+# 1. CACHÉ COMPARTIDA DE LECTURAS
+# ==========================================
+# Una copia por libro (logia) y por proceso, compartida entre sesiones.
+# Cada hoja se descarga como máximo una vez por TTL; toda escritura invalida
+# su hoja. Cada logia tiene un tope de memoria: al pasarlo se sueltan
+# primero las entradas vencidas y luego las usadas hace más tiempo (LRU).
+HOJAS = ["DIRECTORIO", "TESORERIA", "ASISTENCIAS", "LIBRO_CAJA"]
+TTL_DEFAULT = 300  # segundos; se puede cambiar con `cache_ttl` en secrets
+MEMORIA_LOGIA_MB = 256  # tope por logia; `memoria_cache_mb` en secrets
+
+
+def ttl_configurado():
+    return secreto("cache_ttl", TTL_DEFAULT, int)
+
+
+def memoria_configurada():
+    return secreto("memoria_cache_mb", MEMORIA_LOGIA_MB, float) * 2**20
+
+
+def _tamano(valor):
+    # Bytes aproximados de lo que se guarda (DataFrames, índices en dict)
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(index=True, deep=True).sum())
+    if isinstance(valor, dict):
+        return sys.getsizeof(valor) + sum(_tamano(v) for v in valor.values())
+    return sys.getsizeof(valor)
+
+
+def _hoja_de(clave):
+    # Las claves son el nombre de la hoja o (nombre, detalle) para datos
+    # derivados de ella (p. ej. una proyección de columnas).
+    return clave if isinstance(clave, str) else clave[0]
+
+
+class CacheHojas:
+    def __init__(self, ttl, limite=float("inf")):
+        self.ttl = ttl
+        self.limite = limite   # bytes
+        self.ocupado = 0
+        self._datos = OrderedDict()  # clave -> (momento, vence, valor), de menos a más reciente
+        self._tamanos = {}
+        self._versiones = {}   # hoja -> contador de invalidaciones
+        self._candados = {}
+        self._lock = threading.Lock()
+
+    def _candado(self, clave):
+        with self._lock:
+            return self._candados.setdefault(clave, threading.Lock())
+
+    def obtener(self, clave, margen=0):
+        # Con `margen`, lo que vence en menos de esos segundos cuenta como vencido
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is not None:
+                self._datos.move_to_end(clave)
+        if entrada is None or time.monotonic() + margen > entrada[1]:
+            return None
+        return entrada[2]
+
+    def edad(self, clave):
+        with self._lock:
+            entrada = self._datos.get(clave)
+        return time.monotonic() - entrada[0] if entrada else float("inf")
+
+    def obtener_varias_o_cargar(self, claves, cargar_varias, ttl=None, margen=0):
+        resultado = {c: self.obtener(c, margen) for c in claves}
+        faltantes = sorted((c for c, df in resultado.items() if df is None), key=str)
+        for c, df in resultado.items():
+            registrar_cache(c, df is not None)
+        if not faltantes:
+            return resultado
+        # Un solo hilo descarga cada hoja; los demás esperan y reutilizan.
+        # Candados en orden fijo para no bloquearnos entre vistas.
+        candados = [self._candado(c) for c in faltantes]
+        for cd in candados:
+            cd.acquire()
+        try:
+            for c in faltantes:
+                resultado[c] = self.obtener(c, margen)
+            pendientes = [c for c in faltantes if resultado[c] is None]
+            if pendientes:
+                with self._lock:
+                    versiones = {c: self._versiones.get(_hoja_de(c), 0) for c in pendientes}
+                nuevos = cargar_varias(pendientes)
+                ahora = time.monotonic()
+                vence = ahora + (self.ttl if ttl is None else ttl)
+                tamanos = {c: _tamano(nuevos[c]) for c in pendientes}
+                with self._lock:
+                    for c in pendientes:
+                        # Si hubo una escritura durante la descarga, no guardamos datos viejos
+                        if self._versiones.get(_hoja_de(c), 0) == versiones[c]:
+                            self._quitar(c)
+                            self._datos[c] = (ahora, vence, nuevos[c])
+                            self._tamanos[c] = tamanos[c]
+                            self.ocupado += tamanos[c]
+                    self._liberar(conservar=set(pendientes))
+                resultado.update(nuevos)
+        finally:
+            for cd in reversed(candados):
+                cd.release()
+        return resultado
+
+    def obtener_o_cargar(self, clave, cargar, ttl=None):
+        return self.obtener_varias_o_cargar([clave], lambda _: {clave: cargar()}, ttl)[clave]
+
+    def _quitar(self, clave):
+        # Con self._lock tomado
+        if self._datos.pop(clave, None) is not None:
+            self.ocupado -= self._tamanos.pop(clave)
+
+    def _liberar(self, conservar=()):
+        # Con self._lock tomado: vencidas primero, luego las menos usadas.
+        # Lo recién cargado se conserva aunque solo ello pase el tope.
+        if self.ocupado <= self.limite:
+            return
+        ahora = time.monotonic()
+        vencidas = [c for c, e in self._datos.items() if e[1] < ahora and c not in conservar]
+        antiguas = [c for c in self._datos if c not in conservar]
+        for c in vencidas + antiguas:
+            if self.ocupado <= self.limite:
+                break
+            self._quitar(c)
+
+    def descartar(self, clave):
+        with self._lock:
+            self._quitar(clave)
+
+    def invalidar(self, nombre):
+        with self._lock:
+            for clave in [c for c in self._datos if _hoja_de(c) == nombre]:
+                self._quitar(clave)
+            self._versiones[nombre] = self._versiones.get(nombre, 0) + 1
+
+    def limpiar(self):
+        with self._lock:
+            for nombre in {_hoja_de(c) for c in self._datos}:
+                self._versiones[nombre] = self._versiones.get(nombre, 0) + 1
+            self._datos.clear()
+            self._tamanos.clear()
+            self.ocupado = 0
+
+
+@st.cache_resource
+def obtener_cache(id_libro):
+    return CacheHojas(ttl_configurado(), memoria_configurada())
+
+
+# ==========================================
+# 2. MANEJADORES DE HOJAS (UNA VEZ POR PROCESO)
+# ==========================================
+@st.cache_resource
+def _manejadores(id_libro):
+    return {}
+
+
+@st.cache_resource
+def _hojas_faltantes(id_libro):
+    return {}  # nombre -> momento en que se comprobó que no existe
+
+
+def hoja(sh, nombre):
+    hojas = _manejadores(sh.id)
+    if nombre not in hojas:
+        # Una sola llamada de metadatos resuelve todas las pestañas
+        hojas.update({ws.title: ws for ws in sh.worksheets()})
+        if nombre not in hojas:
+            hojas[nombre] = sh.worksheet(nombre)  # lanza WorksheetNotFound
+    return hojas[nombre]
+
+
+def existe_hoja(sh, nombre):
+    # Las hojas opcionales (p. ej. SALDOS) que no existen se recuerdan por
+    # un TTL para no pedir metadatos en cada lectura.
+    faltantes = _hojas_faltantes(sh.id)
+    if time.monotonic() - faltantes.get(nombre, float("-inf")) < obtener_cache(sh.id).ttl:
+        return False
+    try:
+        hoja(sh, nombre)
+    except WorksheetNotFound:
+        faltantes[nombre] = time.monotonic()
+        return False
+    return True
+
+
+def crear_hoja(sh, nombre, encabezado):
+    ws = sh.add_worksheet(title=nombre, rows=100, cols=len(encabezado))
+    ws.update(range_name="A1", values=[encabezado])
+    _manejadores(sh.id)[nombre] = ws
+    _hojas_faltantes(sh.id).pop(nombre, None)
+    return ws
+
+
+# ==========================================
+# 3. LECTURA EN LOTE / INVALIDACIÓN
+# ==========================================
+def a_dataframe(valores):
+    # Mismo resultado que get_all_records(): encabezado en la fila 1,
+    # filas rellenadas al ancho del encabezado y números convertidos.
+    if not valores:
+        return pd.DataFrame()
+    encabezado = valores[0]
+    ancho = len(encabezado)
+    filas = [numericise_all((fila + [""] * ancho)[:ancho]) for fila in valores[1:]]
+    return pd.DataFrame(filas, columns=encabezado)
+
+
+def _descargar(sh, nombres):
+    # Las hojas se tipan aquí (esquema.py): la caché guarda DataFrames tipados
+    espejo = obtener_espejo(sh.id)
+    if espejo is not None:
+        _sincronizar_o_usar_local(sh, nombres, espejo)
+        return {n: tipar_hoja(n, espejo.leer(n)) for n in nombres}
+    resp = sh.values_batch_get([f"'{n}'" for n in nombres])
+    dfs = {}
+    for n, vr in zip(nombres, resp.get("valueRanges", [])):
+        with medir("a_dataframe", detalle=n):
+            dfs[n] = tipar_hoja(n, a_dataframe(vr.get("values", [])))
+    return dfs
+
+
+def leer_hojas(sh, nombres, margen=0):
+    # Todas las hojas que no estén en caché se piden en un solo values_batch_get
+    dfs = obtener_cache(sh.id).obtener_varias_o_cargar(
+        list(nombres), lambda faltantes: _descargar(sh, faltantes), margen=margen
+    )
+    # Copias: las vistas modifican sus DataFrames y la caché es compartida
+    return {n: df.copy() for n, df in dfs.items()}
+
+
+def leer_hoja(sh, nombre):
+    return leer_hojas(sh, [nombre])[nombre]
+
+
+def invalidar(sh, *nombres):
+    cache = obtener_cache(sh.id)
+    espejo = obtener_espejo(sh.id)
+    for nombre in nombres:
+        cache.invalidar(nombre)
+        if espejo is not None:
+            espejo.marcar_pendiente(nombre)
+
+
+# ==========================================
+# 4. LECTURA DE COLUMNAS (PROYECCIÓN POR ENCABEZADO)
+# ==========================================
+@st.cache_resource
+def _encabezados(id_libro):
+    return {}
+
+
+def _letra(num_col):
+    return rowcol_to_a1(1, num_col)[:-1]
+
+
+# Sin estas columnas la vista no tiene con qué trabajar: se lanza KeyError.
+# Las demás (Email, Profesion, ...) son opcionales como en el expediente
+# original: si la hoja no las tiene, vienen en blanco.
+COLUMNAS_CLAVE = {"ID_H", "Usuario", "Password", "Nombre_Completo"}
+
+
+def _requeridas(nombre, columnas):
+    return [c for c in columnas if c in COLUMNAS_CLAVE or c in ESQUEMAS.get(nombre, {})]
+
+
+def _descargar_columnas(sh, nombre, columnas):
+    encabezados = _encabezados(sh.id)
+    requeridas = _requeridas(nombre, columnas)
+    for intento in range(2):
+        if intento or nombre not in encabezados:
+            encabezados[nombre] = hoja(sh, nombre).row_values(1)
+        encabezado = encabezados[nombre]
+        presentes = [c for c in columnas if c in encabezado]
+        if any(c not in encabezado for c in requeridas):
+            continue
+        if not presentes:
+            return pd.DataFrame({c: pd.Series(dtype=object) for c in columnas}, columns=columnas)
+        letras = [_letra(encabezado.index(c) + 1) for c in presentes]
+        rangos = [f"'{nombre}'!{l}:{l}" for l in letras]
+        resp = sh.values_batch_get(rangos, params={"majorDimension": "COLUMNS"})
+        valores = [(vr.get("values") or [[]])[0] for vr in resp.get("valueRanges", [])]
+        # La primera celda de cada columna debe seguir siendo su encabezado;
+        # si alguien movió columnas en la hoja, releemos el encabezado.
+        if all(v[:1] == [c] for v, c in zip(valores, presentes)):
+            alto = max(len(v) for v in valores) - 1
+            leidas = {c: numericise_all((v[1:] + [""] * alto)[:alto]) for c, v in zip(presentes, valores)}
+            return tipar_hoja(nombre, pd.DataFrame(
+                {c: leidas.get(c, [""] * alto) for c in columnas},
+                columns=columnas,
+            ))
+    faltan = [c for c in requeridas if c not in encabezados[nombre]]
+    raise KeyError(f"{nombre}: no se encontraron las columnas {faltan or columnas}")
+
+
+def leer_columnas(sh, nombre, columnas, margen=0):
+    # Solo descarga las columnas pedidas (un rango A1 por columna, en un lote).
+    # Si la hoja completa ya está en caché, se proyecta sin ir a la red.
+    columnas = list(columnas)
+    cache = obtener_cache(sh.id)
+    completa = cache.obtener(nombre, margen)
+    if completa is not None and all(c in completa.columns for c in columnas):
+        return completa[columnas].copy()
+    clave = (nombre, tuple(columnas))
+    df = cache.obtener_varias_o_cargar(
+        [clave], lambda _: {clave: _descargar_columnas(sh, nombre, columnas)}, margen=margen
+    )[clave]
+    return df.copy()
+
+
+# ==========================================
+# 5. ÍNDICE DE USUARIOS (LOGIN)
+# ==========================================
+# usuario -> {Password, Rol, ID_H, Nombre_Completo, Grado_Actual}. No vence por
+# TTL: se reconstruye cuando se escribe DIRECTORIO (Alta / Edición) o cuando
+# llega un usuario desconocido y el índice ya tiene cierta antigüedad.
+# Cada reconstrucción se copia a la copia local de credenciales (acceso.py).
+COLS_LOGIN = ["Usuario", "Password", "Rol", "ID_H", "Nombre_Completo", "Grado_Actual"]
+CLAVE_INDICE = ("DIRECTORIO", "indice_usuarios")
+REFRESCO_INDICE = 60  # segundos mínimos entre reconstrucciones por usuario desconocido
+
+
+def _construir_indice(sh):
+    indice = {}
+    for r in leer_columnas(sh, "DIRECTORIO", COLS_LOGIN).to_dict("records"):
+        # Como antes, si un usuario está repetido gana la primera fila
+        indice.setdefault(str(r["Usuario"]), r)
+    guardar_credenciales(getattr(sh, "logia", None), {
+        u: {k: _plano(v) for k, v in r.items() if k != "Usuario"} for u, r in indice.items()
+    })
+    return indice
+
+
+def _plano(valor):
+    # Valor tipado por esquema.py -> tipo de JSON
+    if pd.isna(valor):
+        return None
+    return int(valor) if isinstance(valor, numbers.Integral) else str(valor)
+
+
+def buscar_usuario(sh, usuario):
+    cache = obtener_cache(sh.id)
+    indice = cache.obtener_o_cargar(CLAVE_INDICE, lambda: _construir_indice(sh), ttl=float("inf"))
+    if usuario not in indice and cache.edad(CLAVE_INDICE) > REFRESCO_INDICE:
+        cache.descartar(CLAVE_INDICE)
+        indice = cache.obtener_o_cargar(CLAVE_INDICE, lambda: _construir_indice(sh), ttl=float("inf"))
+    return indice.get(usuario)
+
+
+# ==========================================
+# 6. ESPEJO LOCAL EN SQLITE (OPCIONAL)
+# ==========================================
+# Se activa con `espejo_local = "ruta/al/archivo.db"` en secrets. Las hojas
+# que solo crecen se sincronizan pidiendo únicamente las filas nuevas (más
+# la última ya copiada, para detectar si la hoja se reescribió); DIRECTORIO
+# se copia completo porque sus filas se editan. Una edición a mano de una
+# fila vieja no cambia la última, así que además se copian completas cada
+# REVISION_COMPLETA segundos (como en caja.py). Si la API falla, se sirve
+# lo que haya en disco.
+HOJAS_ANEXAS = ["TESORERIA", "ASISTENCIAS", "LIBRO_CAJA"]
+REVISION_COMPLETA = 3600
+
+
+@st.cache_resource
+def obtener_espejo(id_libro):
+    ruta = secreto("espejo_local")
+    varias = bool(secreto("logias"))
+    if not ruta:
+        return None
+    if varias:
+        # Un archivo por libro: "espejo.db" -> "espejo.<id del libro>.db"
+        base, ext = os.path.splitext(ruta)
+        ruta = f"{base}.{re.sub(r'[^A-Za-z0-9_-]+', '_', id_libro)}{ext}"
+    return EspejoLocal(ruta)
+
+
+def _fila_normal(fila, ancho):
+    fila = [str(v) for v in fila[:ancho]]
+    while fila and fila[-1] == "":
+        fila.pop()
+    return fila
+
+
+def sincronizar(sh, nombres, espejo):
+    # Todas las hojas en un solo values_batch_get (dos rangos por hoja anexa)
+    rangos, planes = [], []
+    for n in nombres:
+        estado = espejo.estado(n)
+        if (
+            n in HOJAS_ANEXAS and estado and estado["encabezado"]
+            and time.time() - estado["completo"] <= REVISION_COMPLETA
+        ):
+            letra = _letra(len(estado["encabezado"]))
+            planes.append((n, estado, len(rangos)))
+            rangos += [f"'{n}'!1:1", f"'{n}'!A{estado['filas'] + 1}:{letra}"]
+        else:
+            planes.append((n, None, len(rangos)))
+            rangos.append(f"'{n}'")
+    resp = sh.values_batch_get(rangos)
+    valores = [vr.get("values", []) for vr in resp.get("valueRanges", [])]
+
+    completas = []
+    for n, estado, i in planes:
+        if estado is None:
+            df = a_dataframe(valores[i])
+            espejo.reemplazar(n, df, _fila_normal(valores[i][-1], len(df.columns)) if valores[i] else [])
+            continue
+        encabezado = (valores[i] or [[]])[0]
+        cola = valores[i + 1]
+        ancho = len(encabezado)
+        # La fila que ya teníamos debe seguir en su lugar; si no, la hoja
+        # se truncó o se editó y hay que copiarla completa.
+        if encabezado != estado["encabezado"] or not cola or _fila_normal(cola[0], ancho) != estado["ultima"]:
+            completas.append(n)
+            continue
+        nuevas = cola[1:]
+        ultima = _fila_normal(nuevas[-1], ancho) if nuevas else estado["ultima"]
+        espejo.anexar(n, a_dataframe([encabezado] + nuevas), estado["filas"] + len(nuevas), ultima)
+
+    if completas:
+        resp = sh.values_batch_get([f"'{n}'" for n in completas])
+        for n, vr in zip(completas, resp.get("valueRanges", [])):
+            vals = vr.get("values", [])
+            df = a_dataframe(vals)
+            espejo.reemplazar(n, df, _fila_normal(vals[-1], len(df.columns)) if vals else [])
+
+
+def _sincronizar_o_usar_local(sh, nombres, espejo):
+    try:
+        sincronizar(sh, nombres, espejo)
+    except Exception:
+        # Cuota agotada o sin red: si ya hay copia local de todo, la usamos
+        if any(espejo.estado(n) is None for n in nombres):
+            raise
+
+
+def movimientos(sh, nombres, id_h):
+    # Filas de un solo H:. en varias hojas. Con espejo: consulta SQL por el
+    # índice de ID_H; sin espejo: filtra las hojas de la caché en memoria.
+    espejo = obtener_espejo(sh.id)
+    if espejo is None:
+        dfs = leer_hojas(sh, nombres)
+        return {
+            n: df[df['ID_H'] == int(id_h)] if 'ID_H' in df.columns else df
+            for n, df in dfs.items()
+        }
+    ttl = obtener_cache(sh.id).ttl
+    vencidas = [n for n in nombres if (espejo.estado(n) or {}).get("actualizado", 0) < time.time() - ttl]
+    if vencidas:
+        _sincronizar_o_usar_local(sh, vencidas, espejo)
+    return {n: tipar_hoja(n, espejo.filas_de(n, id_h)) for n in nombres}
+
+
+# ==========================================
+# 7. ESCRITURAS EN LOTE CON REINTENTOS
+# ==========================================
+# Una operación lógica (p. ej. un pago: TESORERIA + LIBRO_CAJA) se manda
+# como UN batch_update del libro: las filas de cada hoja se juntan en un
+# solo appendCells y las ediciones van como updateCells. La API aplica el
+# lote completo o nada, así que los libros no quedan a medias. Los valores
+# se guardan tal cual (igual que append_row/update con RAW).
+REINTENTOS = 5
+ESPERA_INICIAL = 1.0  # segundos; se duplica en cada reintento
+CODIGOS_REINTENTABLES = (429, 503)  # cuota agotada / servicio no disponible
+# Un 429 se rechaza antes de aplicar nada; tras un 503 el lote pudo haberse
+# aplicado. Reintentar lecturas o updateCells no cambia el resultado, pero
+# un appendCells o deleteDimension repetido duplicaría o borraría filas de
+# más: esos solo se reintentan por cuota.
+CODIGOS_CUOTA = (429,)
+
+
+def _vacia(valor):
+    return isinstance(valor, str) and valor == "" or not isinstance(valor, str) and pd.isna(valor)
+
+
+def _celda(valor):
+    if _vacia(valor):
+        return {}
+    if isinstance(valor, bool):
+        return {"userEnteredValue": {"boolValue": valor}}
+    if isinstance(valor, (date, pd.Timestamp)):
+        # Las fechas tipadas vuelven a la hoja como texto "dd/mm/YYYY"
+        return {"userEnteredValue": {"stringValue": valor.strftime(FORMATO_FECHA)}}
+    if isinstance(valor, numbers.Number):
+        return {"userEnteredValue": {"numberValue": float(valor)}}
+    return {"userEnteredValue": {"stringValue": str(valor)}}
+
+
+def _filas_api(filas):
+    return [{"values": [_celda(v) for v in fila]} for fila in filas]
+
+
+def con_reintentos(llamada, codigos=CODIGOS_REINTENTABLES):
+    for intento in range(REINTENTOS):
+        try:
+            return llamada()
+        except APIError as e:
+            codigo = getattr(e, "code", None) or e.response.status_code
+            if codigo not in codigos or intento == REINTENTOS - 1:
+                raise
+            time.sleep(ESPERA_INICIAL * 2 ** intento + random.random())
+
+
+class LoteEscritura:
+    def __init__(self, sh):
+        self.sh = sh
+        self._anexos = {}        # hoja -> filas por agregar
+        self._ediciones = []     # (hoja, fila, columna, filas de valores)
+        self._eliminaciones = []  # (hoja, primera fila, última fila)
+
+    def anexar(self, nombre, filas):
+        self._anexos.setdefault(nombre, []).extend(filas)
+        return self
+
+    def actualizar(self, nombre, fila, columna, valores):
+        # fila/columna en base 1, como en la hoja; `valores` es una lista de filas
+        self._ediciones.append((nombre, fila, columna, valores))
+        return self
+
+    def eliminar_filas(self, nombre, desde, hasta):
+        # Filas desde..hasta inclusive (base 1). Se aplican al final del lote,
+        # después de agregar y editar.
+        self._eliminaciones.append((nombre, desde, hasta))
+        return self
+
+    def pedidos(self):
+        pedidos = [
+            {"appendCells": {"sheetId": hoja(self.sh, n).id, "rows": _filas_api(filas), "fields": "userEnteredValue"}}
+            for n, filas in self._anexos.items() if filas
+        ]
+        pedidos += [
+            {"updateCells": {
+                "start": {"sheetId": hoja(self.sh, n).id, "rowIndex": fila - 1, "columnIndex": columna - 1},
+                "rows": _filas_api(valores),
+                "fields": "userEnteredValue",
+            }}
+            for n, fila, columna, valores in self._ediciones
+        ]
+        for n, desde, hasta in self._eliminaciones:
+            id_hoja = hoja(self.sh, n).id
+            # Una fila vacía extra: la API no deja borrar todas las filas no
+            # congeladas y la hoja puede quedar solo con el encabezado.
+            pedidos.append({"appendDimension": {"sheetId": id_hoja, "dimension": "ROWS", "length": 1}})
+            pedidos.append({"deleteDimension": {"range": {
+                "sheetId": id_hoja, "dimension": "ROWS", "startIndex": desde - 1, "endIndex": hasta,
+            }}})
+        return pedidos
+
+    def ejecutar(self):
+        pedidos = self.pedidos()
+        if not pedidos:
+            return
+        idempotente = not any(self._anexos.values()) and not self._eliminaciones
+        con_reintentos(
+            lambda: self.sh.batch_update({"requests": pedidos}),
+            CODIGOS_REINTENTABLES if idempotente else CODIGOS_CUOTA,
+        )
+        _ajustar_indices(self.sh, self._anexos, {e[0] for e in self._eliminaciones})
+        invalidar(self.sh, *{n for n in self._anexos} | {e[0] for e in self._ediciones + self._eliminaciones})
+        self._anexos, self._ediciones, self._eliminaciones = {}, [], []
+
+
+# ==========================================
+# 8. LECTURAS INDEPENDIENTES EN PARALELO
+# ==========================================
+# gspread bloquea mientras espera a la API: las lecturas que no dependen
+# entre sí (p. ej. DIRECTORIO y ASISTENCIAS) se lanzan juntas y la vista
+# tarda lo que la más lenta. El pool es uno por proceso y acotado, así que
+# entre todas las sesiones nunca hay más de `hilos_lectura` llamadas a la
+# vez. Las tareas no deben llamar a su vez a en_paralelo.
+HILOS_LECTURA = 4
+
+
+@st.cache_resource
+def _pool_lecturas():
+    hilos = secreto("hilos_lectura", HILOS_LECTURA, int)
+    return ThreadPoolExecutor(max_workers=max(hilos, 1), thread_name_prefix="lectura")
+
+
+def _preparar(sh):
+    # Los recursos de st.cache_resource se crean aquí, en el hilo de la
+    # vista; en los hilos del pool solo se consultan (ya existen).
+    obtener_cache(sh.id)
+    obtener_espejo(sh.id)
+    obtener_registro()
+    obtener_limitadores()
+    _manejadores(sh.id)
+    _hojas_faltantes(sh.id)
+    _encabezados(sh.id)
+
+
+def en_paralelo(sh, tareas):
+    # tareas: {clave: función sin argumentos} -> {clave: resultado}
+    _preparar(sh)
+    if len(tareas) < 2:
+        return {k: f() for k, f in tareas.items()}
+    pool = _pool_lecturas()
+    # Cada tarea corre con el contexto de la vista (etiqueta de métricas)
+    futuros = {k: pool.submit(contextvars.copy_context().run, f) for k, f in tareas.items()}
+    return {k: f.result() for k, f in futuros.items()}
+
+
+# ==========================================
+# 9. PRECARGA Y REFRESCO EN SEGUNDO PLANO
+# ==========================================
+# Al entrar, se piden en el pool las hojas de todas las vistas del rol: el
+# primer clic ya sale de memoria (si la vista llega antes, espera en el
+# mismo candado de la caché en lugar de descargar otra vez). Un hilo por
+# libro vuelve a cargar lo precargado antes de que venza, mientras alguien
+# haya entrado en las últimas VIGENCIA_PRECARGA horas.
+# Lecturas: "HOJA" (completa) o ("HOJA", [columnas]), igual que en las vistas.
+HOJAS_OPCIONALES = ["SALDOS"]
+VIGENCIA_PRECARGA = 4 * 3600
+
+
+def _clave_lectura(lectura):
+    return lectura if isinstance(lectura, str) else (lectura[0], tuple(lectura[1]))
+
+
+def _cargar_lecturas(sh, lecturas, margen=0):
+    completas = [
+        l for l in lecturas
+        if isinstance(l, str) and (l not in HOJAS_OPCIONALES or existe_hoja(sh, l))
+    ]
+    if completas:
+        leer_hojas(sh, completas, margen)
+    for l in lecturas:
+        if not isinstance(l, str):
+            leer_columnas(sh, l[0], l[1], margen)
+
+
+class Refrescador:
+    def __init__(self, sh, ttl):
+        self.sh = sh
+        self.periodo = max(ttl / 4, 1)
+        self._lecturas = {}  # clave -> (lectura, último registro)
+        self._lock = threading.Lock()
+        self._hilo = None
+
+    def registrar(self, lecturas):
+        ahora = time.monotonic()
+        with self._lock:
+            for l in lecturas:
+                self._lecturas[_clave_lectura(l)] = (l, ahora)
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._ciclo, name="refresco", daemon=True)
+                self._hilo.start()
+
+    def _ciclo(self):
+        etiquetar_vista("Refresco")
+        while True:
+            time.sleep(self.periodo)
+            limite = time.monotonic() - VIGENCIA_PRECARGA
+            with self._lock:
+                for clave in [c for c, (_, t) in self._lecturas.items() if t < limite]:
+                    del self._lecturas[clave]
+                lecturas = [l for l, _ in self._lecturas.values()]
+            try:
+                # Se recarga lo que vencería antes del siguiente ciclo (con holgura)
+                _cargar_lecturas(self.sh, lecturas, margen=self.periodo * 1.2)
+            except Exception:
+                pass  # cuota o red: se reintenta en el siguiente ciclo
+
+
+@st.cache_resource
+def _refrescador(id_libro, _sh, ttl):
+    return Refrescador(_sh, ttl)
+
+
+def precargar(sh, lecturas):
+    # No espera: devuelve el Future de la carga
+    _preparar(sh)
+    lecturas = list({_clave_lectura(l): l for l in lecturas}.values())
+    _refrescador(sh.id, sh, obtener_cache(sh.id).ttl).registrar(lecturas)
+    contexto = contextvars.copy_context()
+    contexto.run(etiquetar_vista, "Precarga")
+    return _pool_lecturas().submit(contexto.run, _cargar_lecturas, sh, lecturas)
+
+
+# ==========================================
+# 10. EXPEDIENTES POR ID_H (FILA EN LA HOJA)
+# ==========================================
+# ID_H -> número de fila de DIRECTORIO (ID_H en la columna A). Editar celdas
+# no mueve filas, así que el índice sobrevive a las invalidaciones y cada
+# alta lo extiende; solo se descarta si se borran filas del libro o si una
+# fila ya no tiene el ID esperado (alguien la movió a mano en la hoja).
+# No ve las filas que se capturen a mano después de construirlo: quien
+# necesite la hoja al día (folios.py) llama antes a refrescar_filas.
+HOJA_EXPEDIENTES = "DIRECTORIO"
+
+
+class IndiceFilas:
+    def __init__(self, ids):
+        self.filas = {}
+        self.ultima = 1  # encabezado
+        self.anexar(ids)
+
+    def anexar(self, ids):
+        for id_h in enteros(pd.Series(list(ids), dtype=object)):
+            self.ultima += 1
+            if pd.notna(id_h):
+                # Como en el login, si un ID está repetido gana la primera fila
+                self.filas.setdefault(int(id_h), self.ultima)
+
+
+@st.cache_resource
+def _indices_filas(id_libro):
+    return {}  # hoja -> IndiceFilas
+
+
+def _ajustar_indices(sh, anexos, eliminadas):
+    indices = _indices_filas(sh.id)
+    for n in eliminadas:
+        indices.pop(n, None)
+    for n, filas in anexos.items():
+        if n in indices:
+            indices[n].anexar(f[0] if f else None for f in filas)
+
+
+def fila_de_hermano(sh, id_h):
+    indices = _indices_filas(sh.id)
+    if HOJA_EXPEDIENTES not in indices:
+        indices[HOJA_EXPEDIENTES] = IndiceFilas(leer_columnas(sh, HOJA_EXPEDIENTES, ["ID_H"])['ID_H'])
+    return indices[HOJA_EXPEDIENTES].filas.get(int(id_h))
+
+
+def refrescar_filas(sh):
+    # Relee solo la columna ID_H (una llamada, sin caché) y rehace el índice
+    valores = con_reintentos(lambda: hoja(sh, HOJA_EXPEDIENTES).get("A2:A"))
+    _indices_filas(sh.id)[HOJA_EXPEDIENTES] = IndiceFilas(f[0] if f else None for f in valores)
+
+
+def _descartar_indice(sh):
+    _indices_filas(sh.id).pop(HOJA_EXPEDIENTES, None)
+    invalidar(sh, HOJA_EXPEDIENTES)
+
+
+def _descargar_expediente(sh, id_h):
+    for intento in range(2):
+        fila = fila_de_hermano(sh, id_h)
+        if fila is None:
+            return None
+        # Encabezado y fila en una sola llamada
+        resp = sh.values_batch_get([f"'{HOJA_EXPEDIENTES}'!1:1", f"'{HOJA_EXPEDIENTES}'!{fila}:{fila}"])
+        encabezado, valores = [(vr.get("values") or [[]])[0] for vr in resp.get("valueRanges", [])]
+        _encabezados(sh.id)[HOJA_EXPEDIENTES] = encabezado
+        registro = tipar_hoja(HOJA_EXPEDIENTES, a_dataframe([encabezado, valores])).iloc[0].to_dict()
+        if registro.get('ID_H') == int(id_h):
+            return registro
+        _descartar_indice(sh)
+    return None
+
+
+def leer_expediente(sh, id_h):
+    # Registro completo (dict por encabezado) de un H:. sin bajar todo DIRECTORIO
+    completa = obtener_cache(sh.id).obtener(HOJA_EXPEDIENTES)
+    if completa is not None:
+        fila = completa[completa['ID_H'] == int(id_h)]
+        return fila.iloc[0].to_dict() if not fila.empty else None
+    clave = (HOJA_EXPEDIENTES, ("expediente", int(id_h)))
+    registro = obtener_cache(sh.id).obtener_o_cargar(clave, lambda: _descargar_expediente(sh, id_h))
+    return dict(registro) if registro is not None else None
+
+
+def _misma_celda(a, b):
+    # Compara como quedaría en la hoja: 5512345678 == "5512345678", NaN == ""
+    if _vacia(a) or _vacia(b):
+        return _vacia(a) and _vacia(b)
+    if isinstance(a, numbers.Number) and isinstance(b, numbers.Number):
+        return float(a) == float(b)
+    return str(a) == str(b)
+
+
+def guardar_expediente(sh, id_h, original, fila_nueva):
+    # `original` es el registro cargado y `fila_nueva` la fila completa en el
+    # orden de la hoja. Solo se mandan las celdas que cambiaron (un
+    # updateCells por tramo contiguo, todos en un batch_update). Regresa
+    # cuántas celdas se escribieron.
+    viejos = list(original.values())
+    cambios = [i for i, v in enumerate(fila_nueva) if i >= len(viejos) or not _misma_celda(viejos[i], v)]
+    if not cambios:
+        return 0
+    # Sheets no tiene escrituras condicionales: justo antes de escribir se
+    # comprueba que la fila siga siendo la del H:. (una celda).
+    for intento in range(2):
+        fila = fila_de_hermano(sh, id_h)
+        celda = hoja(sh, HOJA_EXPEDIENTES).get(f"A{fila}") if fila else []
+        if celda and celda[0] and str(celda[0][0]).strip() == str(int(id_h)):
+            break
+        _descartar_indice(sh)
+    else:
+        raise ValueError(f"El expediente {id_h} ya no está en DIRECTORIO; recarga la página")
+    lote = LoteEscritura(sh)
+    for _, tramo in itertools.groupby(enumerate(cambios), lambda par: par[1] - par[0]):
+        columnas = [i for _, i in tramo]
+        lote.actualizar(HOJA_EXPEDIENTES, fila, columnas[0] + 1, [[fila_nueva[i] for i in columnas]])
+    lote.ejecutar()
+    return len(cambios)
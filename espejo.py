@@ -0,0 +1,109 @@
+import json
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+# ==========================================
+# ESPEJO LOCAL (SQLite) DE LAS HOJAS
+# ==========================================
+# Copia en disco de las hojas para leer sin ir a Google Sheets. Solo guarda
+# y consulta; la sincronización (qué pedir a la API) vive en datos.py.
+# Las columnas que empiezan con "_" son internas (no vienen de la hoja).
+INDICES = {
+    "DIRECTORIO": ["ID_H", "Usuario"],
+    "TESORERIA": ["ID_H", "_fecha"],
+    "ASISTENCIAS": ["ID_H", "_fecha"],
+    "LIBRO_CAJA": ["_fecha"],
+}
+COLUMNAS_FECHA = ["Fecha", "Fecha_Tenida"]
+
+
+def _con_fecha_iso(df):
+    # Fecha "dd/mm/YYYY" -> "YYYY-MM-DD" para poder indexar y filtrar por rango
+    df = df.copy()
+    for col in COLUMNAS_FECHA:
+        if col in df.columns:
+            df["_fecha"] = pd.to_datetime(df[col], format="%d/%m/%Y", errors="coerce").dt.strftime("%Y-%m-%d")
+            break
+    return df
+
+
+class EspejoLocal:
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(ruta, check_same_thread=False)
+        self._con.execute(
+            "CREATE TABLE IF NOT EXISTS _sync ("
+            "hoja TEXT PRIMARY KEY, filas INTEGER, encabezado TEXT, ultima TEXT, actualizado REAL, completo REAL)"
+        )
+        try:
+            # Espejos creados antes de guardar la hora de la última copia completa
+            self._con.execute("ALTER TABLE _sync ADD COLUMN completo REAL")
+        except sqlite3.OperationalError:
+            pass
+        self._con.commit()
+
+    # --- Estado de sincronización ---
+    def estado(self, hoja):
+        with self._lock:
+            fila = self._con.execute(
+                "SELECT filas, encabezado, ultima, actualizado, completo FROM _sync WHERE hoja = ?", (hoja,)
+            ).fetchone()
+        if fila is None:
+            return None
+        return {"filas": fila[0], "encabezado": json.loads(fila[1]), "ultima": json.loads(fila[2]), "actualizado": fila[3],
+                "completo": fila[4] or 0}
+
+    def marcar_pendiente(self, hoja):
+        with self._lock:
+            self._con.execute("UPDATE _sync SET actualizado = 0 WHERE hoja = ?", (hoja,))
+            self._con.commit()
+
+    def _guardar_estado(self, hoja, filas, encabezado, ultima, completo=None):
+        # Al anexar se conserva la hora de la última copia completa
+        self._con.execute(
+            "INSERT OR REPLACE INTO _sync (hoja, filas, encabezado, ultima, actualizado, completo) "
+            "VALUES (?, ?, ?, ?, ?, COALESCE(?, (SELECT completo FROM _sync WHERE hoja = ?)))",
+            (hoja, filas, json.dumps(encabezado), json.dumps(ultima), time.time(), completo, hoja),
+        )
+
+    # --- Escritura ---
+    def reemplazar(self, hoja, df, ultima):
+        df_sql = _con_fecha_iso(df)
+        # Columnas sin tipo declarado: SQLite guarda cada valor tal como viene
+        # (números como números, texto como texto), igual que la hoja.
+        columnas = ", ".join(f'"{c}"' for c in df_sql.columns) or '"_vacia"'
+        with self._lock:
+            self._con.execute(f'DROP TABLE IF EXISTS "{hoja}"')
+            self._con.execute(f'CREATE TABLE "{hoja}" ({columnas})')
+            for col in INDICES.get(hoja, []):
+                if col in df_sql.columns:
+                    self._con.execute(f'CREATE INDEX "ix_{hoja}_{col}" ON "{hoja}" ("{col}")')
+            df_sql.to_sql(hoja, self._con, if_exists="append", index=False)
+            self._guardar_estado(hoja, len(df), list(df.columns), ultima, completo=time.time())
+            self._con.commit()
+
+    def anexar(self, hoja, df, filas, ultima):
+        with self._lock:
+            if not df.empty:
+                _con_fecha_iso(df).to_sql(hoja, self._con, if_exists="append", index=False)
+            self._guardar_estado(hoja, filas, list(df.columns), ultima)
+            self._con.commit()
+
+    # --- Lectura ---
+    def consultar(self, sql, params=()):
+        with self._lock:
+            df = pd.read_sql_query(sql, self._con, params=params)
+        return df.drop(columns=[c for c in df.columns if c.startswith("_")])
+
+    def leer(self, hoja):
+        return self.consultar(f'SELECT * FROM "{hoja}" ORDER BY rowid')
+
+    def filas_de(self, hoja, id_h):
+        # ID_H puede estar guardado como número o como texto
+        id_h = str(id_h)
+        id_num = int(id_h) if id_h.isdigit() else id_h
+        return self.consultar(f'SELECT * FROM "{hoja}" WHERE ID_H IN (?, ?) ORDER BY rowid', (id_num, id_h))
@@ -0,0 +1,49 @@
+import pandas as pd
+
+# ==========================================
+# ESQUEMA DE TIPOS POR HOJA
+# ==========================================
+# Se aplica una sola vez al cargar (datos.py), así la caché guarda DataFrames
+# ya tipados y las vistas filtran y agrupan sin volver a convertir:
+#   id / entero -> Int64 (nulo si la celda está vacía o no es entero)
+#   decimal     -> float64
+#   categoria   -> category (pocas etiquetas repetidas: menos memoria)
+#   fecha       -> datetime64 desde "dd/mm/YYYY" (NaT si no se entiende)
+# Las columnas que no aparecen aquí se dejan como vienen de la hoja.
+FORMATO_FECHA = "%d/%m/%Y"
+
+ESQUEMAS = {
+    "DIRECTORIO": {"ID_H": "id", "Grado_Actual": "entero", "Rol": "categoria", "Estatus": "categoria"},
+    "TESORERIA": {"Fecha": "fecha", "ID_H": "id", "Tipo": "categoria", "Monto": "decimal"},
+    "ASISTENCIAS": {"Fecha_Tenida": "fecha", "Grado": "entero", "ID_H": "id", "Estado": "categoria"},
+    "LIBRO_CAJA": {"Fecha": "fecha", "Categoria": "categoria", "Entrada": "decimal", "Salida": "decimal"},
+    "SALDOS": {"ID_H": "id", "Cargos": "decimal", "Abonos": "decimal", "Saldo": "decimal", "Ultimo_Movimiento": "fecha"},
+}
+
+
+def fechas(serie):
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+    return pd.to_datetime(serie, format=FORMATO_FECHA, errors='coerce')
+
+
+def enteros(serie):
+    if isinstance(serie.dtype, pd.Int64Dtype):
+        return serie
+    num = pd.to_numeric(serie, errors='coerce')
+    return num.where(num == num.round()).astype("Int64")
+
+
+CONVERSIONES = {
+    "id": enteros,
+    "entero": enteros,
+    "decimal": lambda s: pd.to_numeric(s, errors='coerce').astype(float),
+    "categoria": lambda s: s.astype("category"),
+    "fecha": fechas,
+}
+
+
+def tipar_hoja(nombre, df):
+    esquema = ESQUEMAS.get(nombre, {})
+    columnas = {c: CONVERSIONES[t](df[c]) for c, t in esquema.items() if c in df.columns}
+    return df.assign(**columnas) if columnas else df
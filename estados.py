@@ -0,0 +1,141 @@
+import csv
+import glob
+import html
+import io
+import os
+import re
+import tempfile
+import time
+import zipfile
+
+import pandas as pd
+
+from calculos import estado_de_cuenta, resumen_asistencia, saldos_por_hermano
+from esquema import FORMATO_FECHA, tipar_hoja
+
+# ==========================================
+# 1. ESTADOS DE CUENTA DE TODO EL TALLER (UN ZIP)
+# ==========================================
+# Lo mismo que "Mi Tablero" muestra a cada H:., pero para todos los activos
+# en una pasada: TESORERIA y ASISTENCIAS se leen una vez, saldos, estatus
+# de cada cargo y % de asistencia salen de operaciones agrupadas, y cada
+# estado se escribe directo al ZIP (en disco) sin juntar todos en memoria.
+# El ZIP lleva un CSV y un HTML por H:. y resumen.csv con todos. Los H:.
+# activos sin ID_H en DIRECTORIO no se pueden cruzar con sus libros: se
+# omiten y se regresan aparte para avisar.
+AVISO_CADA = 25  # H:. entre avisos de progreso
+COLS_ESTADO = ["Fecha", "Concepto", "Estatus", "Falta"]
+SIN_FECHA = "Sin fecha"
+
+PLANTILLA_HTML = """<!DOCTYPE html>
+<html lang="es"><head><meta charset="utf-8"><title>Estado de Cuenta - {nombre}</title>
+<style>body{{font-family:sans-serif;margin:2em}}table{{border-collapse:collapse}}
+td,th{{border:1px solid #ccc;padding:4px 8px}}td:last-child{{text-align:right}}</style></head>
+<body><h2>&there4; Estado de Cuenta</h2>
+<p><b>{nombre}</b> (ID {id_h}) &middot; corte al {corte}</p>
+<p>Saldo pendiente: <b>${saldo:,.2f}</b> &middot; Asistencia: {pct:.1f}% ({asistencias} de {tenidas} tenidas)</p>
+<table><tr><th>Fecha</th><th>Concepto</th><th>Estatus</th><th>Falta</th></tr>{filas}</table>
+</body></html>
+"""
+
+
+def _archivo(id_h, nombre):
+    limpio = re.sub(r"[^A-Za-z0-9]+", "_", nombre).strip("_") or "HH"
+    return f"{int(id_h):04d}_{limpio}"
+
+
+def _csv(encabezado, filas):
+    buf = io.StringIO()
+    escritor = csv.writer(buf)
+    escritor.writerow(encabezado)
+    escritor.writerows(filas)
+    return buf.getvalue()
+
+
+def resumen_estados(tes, asis, directorio):
+    # Una fila por H:. activo: asistencia, cargos, abonos, saldo y pendientes
+    res = resumen_asistencia(asis, directorio)
+    saldos = saldos_por_hermano(tes)
+    res = res.merge(saldos, left_on='ID_H', right_index=True, how='left')
+    res[['Cargo', 'Abono', 'Saldo']] = res[['Cargo', 'Abono', 'Saldo']].fillna(0.0)
+    return res
+
+
+def generar_estados(tes, asis, directorio, destino, corte=None, al_avanzar=None):
+    # Escribe el ZIP en `destino` (ruta o archivo abierto) y regresa
+    # (resumen, nombres de los omitidos por no tener ID_H).
+    # `al_avanzar(hechos, total)` se llama cada AVISO_CADA H:.
+    sin_id = directorio['ID_H'].isna()
+    omitidos = directorio.loc[sin_id & (directorio['Estatus'] == 'Activo'), 'Nombre_Completo'].astype(str).tolist()
+    directorio = directorio[~sin_id]
+    # Libros vacíos (sin encabezado) como tablas vacías con sus columnas
+    if tes.empty:
+        tes = tipar_hoja("TESORERIA", pd.DataFrame(columns=["Fecha", "ID_H", "Concepto", "Tipo", "Monto"]))
+    if asis.empty:
+        asis = tipar_hoja("ASISTENCIAS", pd.DataFrame(columns=["Fecha_Tenida", "Grado", "ID_H", "Estado"]))
+    if corte is not None:
+        # Fechas que no se pudieron leer se quedan (como en saldos y Mi
+        # Tablero) y salen como SIN_FECHA en el estado
+        tes = tes[(tes['Fecha'] <= pd.Timestamp(corte)) | tes['Fecha'].isna()]
+        asis = asis[(asis['Fecha_Tenida'] <= pd.Timestamp(corte)) | asis['Fecha_Tenida'].isna()]
+    corte_txt = pd.Timestamp(corte or pd.Timestamp.today()).strftime(FORMATO_FECHA)
+
+    res = resumen_estados(tes, asis, directorio)
+    estado = estado_de_cuenta(tes)
+    pendientes = estado[estado['Estatus'] != 'Pagado'].groupby('ID_H').size()
+    res['Cargos pendientes'] = res['ID_H'].map(pendientes).fillna(0).astype(int)
+    # Posiciones de las filas de cada H:. (una sola agrupación)
+    filas_de = estado.groupby('ID_H').indices if not estado.empty else {}
+
+    # Columnas ya formateadas una sola vez; por H:. solo se toman sus filas
+    columnas = [
+        estado['Fecha'].dt.strftime(FORMATO_FECHA).fillna(SIN_FECHA).tolist(),
+        estado['Concepto'].astype(str).tolist(),
+        estado['Estatus'].tolist(),
+        estado['Falta'].tolist(),
+    ]
+
+    total = len(res)
+    with zipfile.ZipFile(destino, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for hechos, r in enumerate(res.to_dict("records"), start=1):
+            id_h, nombre = int(r['ID_H']), str(r['Nombre'])
+            # Del más reciente al más viejo, como en Mi Tablero
+            filas = [[col[i] for col in columnas] for i in filas_de.get(id_h, [])[::-1]]
+            base = _archivo(id_h, nombre)
+            zf.writestr(f"csv/{base}.csv", _csv(COLS_ESTADO, filas).encode("utf-8-sig"))
+            zf.writestr(f"html/{base}.html", PLANTILLA_HTML.format(
+                nombre=html.escape(nombre), id_h=id_h, corte=corte_txt, saldo=r['Saldo'],
+                pct=r['% Asist'], asistencias=r['Asistencias'], tenidas=r['Tenidas'],
+                filas="".join(
+                    f"<tr><td>{f}</td><td>{html.escape(c)}</td><td>{e}</td><td>${fa:,.2f}</td></tr>"
+                    for f, c, e, fa in filas
+                ),
+            ))
+            if al_avanzar and (hechos % AVISO_CADA == 0 or hechos == total):
+                al_avanzar(hechos, total)
+        resumen = res[['ID_H', 'Nombre', 'Grado', 'Cargo', 'Abono', 'Saldo', 'Cargos pendientes', 'Tenidas', 'Asistencias', '% Asist']]
+        zf.writestr("resumen.csv", resumen.round(2).to_csv(index=False).encode("utf-8-sig"))
+    return resumen, omitidos
+
+
+# ==========================================
+# 2. ARCHIVOS TEMPORALES DE LOS ZIP
+# ==========================================
+# Cada sesión guarda su último ZIP en el temporal del sistema hasta que lo
+# descarga; al generar uno nuevo se borran los de más de VIGENCIA_ZIP
+# segundos (de sesiones que ya terminaron).
+PREFIJO_ZIP = "estados_"
+VIGENCIA_ZIP = 3600
+
+
+def ruta_zip_nuevo():
+    limite = time.time() - VIGENCIA_ZIP
+    for viejo in glob.glob(os.path.join(tempfile.gettempdir(), f"{PREFIJO_ZIP}*.zip")):
+        try:
+            if os.path.getmtime(viejo) < limite:
+                os.remove(viejo)
+        except OSError:
+            pass  # otra sesión ya lo borró
+    fd, ruta = tempfile.mkstemp(prefix=PREFIJO_ZIP, suffix=".zip")
+    os.close(fd)
+    return ruta
@@ -0,0 +1,81 @@
+import threading
+from datetime import datetime
+
+import streamlit as st
+from gspread.utils import a1_range_to_grid_range
+
+from datos import hoja, existe_hoja, crear_hoja, leer_columnas, con_reintentos, CODIGOS_CUOTA, fila_de_hermano, refrescar_filas, LoteEscritura
+
+# ==========================================
+# 1. FOLIOS DE ID_H (SIN LEER EL DIRECTORIO)
+# ==========================================
+# Cada alta anexa una fila a FOLIOS. Sheets serializa los anexos y la
+# respuesta dice en qué fila quedó, así que el número de fila ES el folio:
+# dos secretarios (o dos servidores) nunca obtienen el mismo. La fila 2 es
+# la semilla (el ID_H más alto al crear la hoja): ID = semilla + (fila - 2).
+# Cuando el expediente se guarda, su ID_H se anota en la fila del folio en
+# el mismo lote; un folio sin ID_H es un alta que no llegó a guardarse.
+HOJA_FOLIOS = "FOLIOS"
+COLS_FOLIOS = ["Fecha", "Reservado_Por", "Usuario", "ID_H"]
+INTENTOS_FOLIO = 3
+
+
+@st.cache_resource
+def _candado_folios(id_libro):
+    # Crear la hoja una sola vez dentro del proceso
+    return threading.Lock()
+
+
+@st.cache_resource
+def _semillas(id_libro):
+    return {}  # la semilla no cambia: se lee una vez por proceso
+
+
+def _hoja_folios(sh):
+    with _candado_folios(sh.id):
+        if not existe_hoja(sh, HOJA_FOLIOS):
+            ids = leer_columnas(sh, "DIRECTORIO", ["ID_H"])['ID_H']
+            semilla = int(ids.max()) if ids.notna().any() else 0
+            ws = crear_hoja(sh, HOJA_FOLIOS, COLS_FOLIOS)
+            ws.update(range_name="A2", values=[[datetime.today().strftime("%d/%m/%Y"), "(semilla)", "", semilla]])
+            _semillas(sh.id)[HOJA_FOLIOS] = semilla
+        return hoja(sh, HOJA_FOLIOS)
+
+
+def _semilla(sh, ws):
+    semillas = _semillas(sh.id)
+    if HOJA_FOLIOS not in semillas:
+        celda = ws.get("D2")
+        semillas[HOJA_FOLIOS] = int(float(celda[0][0])) if celda and celda[0] else 0
+    return semillas[HOJA_FOLIOS]
+
+
+def reservar_folio(sh, reservado_por, usuario):
+    # (ID_H nuevo, fila del folio). Si el ID ya existe en DIRECTORIO (alguien
+    # capturó un alta directo en la hoja) se toma el siguiente folio. La
+    # columna ID_H se relee en cada alta para ver esas capturas; una hecha
+    # entre esta lectura y el guardado del alta sí puede repetir el ID.
+    ws = _hoja_folios(sh)
+    semilla = _semilla(sh, ws)
+    refrescar_filas(sh)
+    fila_nueva = [datetime.today().strftime("%d/%m/%Y"), reservado_por, usuario]
+    for intento in range(INTENTOS_FOLIO):
+        resp = con_reintentos(
+            lambda: ws.append_row(fila_nueva, value_input_option="RAW", table_range="A1"), CODIGOS_CUOTA
+        )
+        rango = resp["updates"]["updatedRange"].split("!")[-1]
+        fila = a1_range_to_grid_range(rango)["startRowIndex"] + 1
+        nuevo_id = semilla + fila - 2
+        if fila_de_hermano(sh, nuevo_id) is None:
+            return nuevo_id, fila
+    raise ValueError("No se pudo reservar un ID_H libre; revisa la hoja FOLIOS")
+
+
+def alta_expediente(sh, fila_directorio, reservado_por):
+    # `fila_directorio` es la fila de DIRECTORIO sin el ID_H: Nombre, Usuario, ...
+    nuevo_id, fila_folio = reservar_folio(sh, reservado_por, fila_directorio[1])
+    (LoteEscritura(sh)
+        .anexar("DIRECTORIO", [[nuevo_id] + list(fila_directorio)])
+        .actualizar(HOJA_FOLIOS, fila_folio, COLS_FOLIOS.index("ID_H") + 1, [[nuevo_id]])
+        .ejecutar())
+    return nuevo_id
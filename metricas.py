@@ -0,0 +1,291 @@
+import contextvars
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+import streamlit as st
+
+from configuracion import secreto
+
+# ==========================================
+# 1. REGISTRO DE EVENTOS (UNO POR PROCESO)
+# ==========================================
+# Cada llamada a la API, paso pesado de pandas, consulta a la caché y rerun
+# completo queda como un evento etiquetado con la vista que lo provocó.
+# Se guardan los últimos MAX_EVENTOS en memoria y, si se configura
+# `registro_metricas = "ruta.jsonl"` en secrets, también en disco.
+MAX_EVENTOS = 5000
+# Cuota por defecto de la API de Sheets por usuario (la cuenta de servicio)
+CUOTA_LECTURAS_MIN = 60
+CUOTA_ESCRITURAS_MIN = 60
+OPS_LECTURA = {"values_batch_get", "get", "row_values", "worksheets", "worksheet"}
+OPS_ESCRITURA = {"batch_update", "update", "append_row", "add_worksheet"}
+
+_vista = contextvars.ContextVar("vista", default="Login")
+_logia = contextvars.ContextVar("logia", default="")
+
+
+class RegistroMetricas:
+    def __init__(self, ruta=None):
+        self.eventos = deque(maxlen=MAX_EVENTOS)
+        self._lock = threading.Lock()
+        self._archivo = open(ruta, "a", encoding="utf-8") if ruta else None
+
+    def agregar(self, tipo, op, ms, **extra):
+        evento = {"t": time.time(), "logia": _logia.get(), "vista": _vista.get(), "tipo": tipo, "op": op, "ms": round(ms, 2), **extra}
+        with self._lock:
+            self.eventos.append(evento)
+            if self._archivo:
+                self._archivo.write(json.dumps(evento, ensure_ascii=False, default=str) + "\n")
+                self._archivo.flush()
+
+    def tabla(self):
+        with self._lock:
+            return pd.DataFrame(list(self.eventos))
+
+    def limpiar(self):
+        with self._lock:
+            self.eventos.clear()
+
+
+@st.cache_resource
+def obtener_registro():
+    return RegistroMetricas(secreto("registro_metricas"))
+
+
+def cuotas():
+    return (secreto("cuota_lecturas_min", CUOTA_LECTURAS_MIN, int),
+            secreto("cuota_escrituras_min", CUOTA_ESCRITURAS_MIN, int))
+
+
+# ==========================================
+# 2. ETIQUETAS Y MEDICIONES
+# ==========================================
+# La vista (y la logia) viajan en ContextVars: los hilos del pool las heredan
+# porque datos.en_paralelo ejecuta cada tarea en una copia del contexto.
+def etiquetar_vista(nombre, logia=None):
+    _vista.set(nombre)
+    if logia is not None:
+        _logia.set(logia)
+
+
+@contextmanager
+def medir(op, tipo="pandas", **extra):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        obtener_registro().agregar(tipo, op, (time.perf_counter() - inicio) * 1000, **extra)
+
+
+@contextmanager
+def medir_rerun():
+    # Todo el rerun de main(), incluido el que corta st.rerun()
+    with medir("rerun", tipo="vista"):
+        yield
+
+
+def registrar_cache(clave, acierto):
+    obtener_registro().agregar("cache", "hit" if acierto else "miss", 0.0, detalle=str(clave))
+
+
+# ==========================================
+# 3. CUOTA COMPARTIDA ENTRE LOGIAS
+# ==========================================
+# Todas las logias usan la misma cuenta de servicio y comparten su cuota por
+# minuto. Cada llamada pide turno en una ventana deslizante de 60 s. Si la
+# cuota se llena y otra logia está esperando, ninguna pasa de su parte justa
+# (cuota / logias activas en la ventana); sin competencia, una sola logia
+# puede usar la cuota completa. Así se espera aquí en lugar de recibir 429.
+VENTANA_CUOTA = 60.0
+
+
+class LimitadorCuota:
+    def __init__(self, por_minuto):
+        self.por_minuto = por_minuto
+        self._llamadas = deque()  # (momento, logia)
+        self._esperando = {}      # logia -> llamadas en espera
+        self._cond = threading.Condition()
+
+    def _puede(self, logia, ahora):
+        while self._llamadas and self._llamadas[0][0] <= ahora - VENTANA_CUOTA:
+            self._llamadas.popleft()
+        if len(self._llamadas) >= self.por_minuto:
+            return False
+        otras = {l for l, n in self._esperando.items() if n and l != logia}
+        if not otras:
+            return True
+        activas = otras | {logia} | {l for _, l in self._llamadas}
+        propias = sum(1 for _, l in self._llamadas if l == logia)
+        return propias < self.por_minuto / len(activas)
+
+    def adquirir(self, logia):
+        # Regresa los segundos que se esperó turno
+        inicio = time.monotonic()
+        with self._cond:
+            self._esperando[logia] = self._esperando.get(logia, 0) + 1
+            try:
+                while True:
+                    ahora = time.monotonic()
+                    if self._puede(logia, ahora):
+                        self._llamadas.append((ahora, logia))
+                        return ahora - inicio
+                    # Se libera un lugar cuando sale de la ventana la llamada más vieja
+                    libre = self._llamadas[0][0] + VENTANA_CUOTA - ahora if self._llamadas else 0.1
+                    self._cond.wait(min(max(libre, 0.01), 1.0))
+            finally:
+                self._esperando[logia] -= 1
+                self._cond.notify_all()
+
+
+@st.cache_resource
+def obtener_limitadores():
+    lecturas, escrituras = cuotas()
+    return {"lectura": LimitadorCuota(lecturas), "escritura": LimitadorCuota(escrituras)}
+
+
+# ==========================================
+# 4. PROXY DEL LIBRO (CADA LLAMADA A LA API)
+# ==========================================
+def _celdas(valores):
+    filas = len(valores)
+    return filas, sum(len(str(v)) for fila in valores for v in fila)
+
+
+def _tamano_respuesta(op, resp):
+    # (filas, bytes aproximados del contenido) de lo que regresó la API
+    if op == "values_batch_get":
+        totales = [_celdas(vr.get("values", [])) for vr in resp.get("valueRanges", [])]
+        return sum(t[0] for t in totales), sum(t[1] for t in totales)
+    if op in ("get", "row_values"):
+        return _celdas(resp if op == "get" else [resp])
+    return 0, 0
+
+
+def _tamano_pedido(op, args, kwargs):
+    if op == "batch_update":
+        cuerpo = args[0] if args else kwargs.get("body", {})
+        filas = sum(len(p.get(t, {}).get("rows", [])) for p in cuerpo.get("requests", []) for t in p)
+        return filas, len(json.dumps(cuerpo, default=str))
+    if op == "update":
+        valores = kwargs.get("values") or (args[1] if len(args) > 1 else [])
+        return _celdas(valores)
+    if op == "append_row":
+        return _celdas([args[0] if args else kwargs.get("values", [])])
+    return 0, 0
+
+
+class _Medido:
+    # Envuelve un libro u hoja: los métodos de la API esperan turno de cuota
+    # y se miden; el resto pasa tal cual
+    _OPS = set()
+
+    def __init__(self, objeto, logia=None):
+        self._objeto = objeto
+        self.logia = logia or str(getattr(objeto, "id", ""))
+
+    def __getattr__(self, nombre):
+        valor = getattr(self._objeto, nombre)
+        if nombre not in self._OPS:
+            return valor
+
+        def llamada(*args, **kwargs):
+            clase = "escritura" if nombre in OPS_ESCRITURA else "lectura"
+            espera = obtener_limitadores()[clase].adquirir(self.logia)
+            if espera > 0.001:
+                obtener_registro().agregar("cuota", clase, espera * 1000, logia=self.logia)
+            inicio = time.perf_counter()
+            error = None
+            try:
+                resp = valor(*args, **kwargs)
+            except Exception as e:
+                error = type(e).__name__
+                raise
+            finally:
+                ms = (time.perf_counter() - inicio) * 1000
+                if error is None:
+                    filas, bytes_ = (_tamano_pedido(nombre, args, kwargs) if nombre in OPS_ESCRITURA
+                                     else _tamano_respuesta(nombre, resp))
+                else:
+                    filas, bytes_ = 0, 0
+                obtener_registro().agregar(
+                    "api", nombre, ms, filas=filas, bytes=bytes_, error=error, detalle=self._detalle(nombre, args, kwargs),
+                    logia=self.logia,
+                )
+            return _envolver_hojas(resp, self.logia)
+        return llamada
+
+
+def _envolver_hojas(resp, logia):
+    if isinstance(resp, list) and resp and hasattr(resp[0], "row_values"):
+        return [HojaMedida(ws, logia) for ws in resp]
+    if hasattr(resp, "row_values") and not isinstance(resp, HojaMedida):
+        return HojaMedida(resp, logia)
+    return resp
+
+
+class HojaMedida(_Medido):
+    _OPS = {"row_values", "get", "update", "append_row"}
+
+    def _detalle(self, op, args, kwargs):
+        return self._objeto.title
+
+
+class LibroMedido(_Medido):
+    _OPS = {"worksheets", "worksheet", "add_worksheet", "values_batch_get", "batch_update"}
+
+    def _detalle(self, op, args, kwargs):
+        if op == "values_batch_get" and args:
+            # Hojas pedidas en el lote ("'HOJA'!A1:B" -> HOJA)
+            return ", ".join(dict.fromkeys(r.split("!")[0].strip("'") for r in args[0]))
+        return args[0] if args and isinstance(args[0], str) else kwargs.get("title")
+
+
+# ==========================================
+# 5. RESÚMENES PARA EL PANEL DE DIAGNÓSTICO
+# ==========================================
+def percentiles(eventos, por):
+    if eventos.empty:
+        return pd.DataFrame(columns=[por, "n", "p50 ms", "p95 ms", "máx ms"])
+    return eventos.groupby(por)["ms"].agg(
+        n="size", **{"p50 ms": lambda s: s.quantile(0.5), "p95 ms": lambda s: s.quantile(0.95), "máx ms": "max"}
+    ).reset_index().sort_values("p95 ms", ascending=False)
+
+
+def _minuto_local(segundos):
+    zona = datetime.now().astimezone().tzinfo
+    return pd.to_datetime(segundos, unit="s", utc=True).dt.tz_convert(zona).dt.tz_localize(None).dt.floor("min")
+
+
+def llamadas_por_minuto(eventos, minutos=30):
+    # Lecturas y escrituras a la API por minuto (hora del servidor)
+    indice = pd.date_range(pd.Timestamp.now().floor("min") - pd.Timedelta(minutes=minutos - 1), periods=minutos, freq="min")
+    api = eventos[eventos["tipo"] == "api"] if not eventos.empty else eventos
+    if api.empty:
+        return pd.DataFrame({"Lecturas": 0, "Escrituras": 0}, index=indice)
+    clase = api["op"].map(lambda op: "Escrituras" if op in OPS_ESCRITURA else "Lecturas")
+    tabla = pd.crosstab(_minuto_local(api["t"]), clase).reindex(columns=["Lecturas", "Escrituras"], fill_value=0)
+    tabla.columns.name = None
+    return tabla.reindex(indice, fill_value=0)
+
+
+def uso_por_logia(eventos, minutos=5):
+    # Llamadas a la API y espera por cuota de cada logia en los últimos minutos
+    columnas = ["Lecturas", "Escrituras", "Espera cuota ms"]
+    if eventos.empty or "logia" not in eventos:
+        return pd.DataFrame(columns=columnas)
+    recientes = eventos[eventos["t"] >= time.time() - minutos * 60]
+    api = recientes[recientes["tipo"] == "api"]
+    clase = api["op"].map(lambda op: "Escrituras" if op in OPS_ESCRITURA else "Lecturas")
+    tabla = pd.crosstab(api["logia"], clase) if not api.empty else pd.DataFrame()
+    tabla = tabla.reindex(columns=columnas[:2], fill_value=0)
+    espera = recientes[recientes["tipo"] == "cuota"].groupby("logia")["ms"].sum()
+    tabla = tabla.reindex(tabla.index.union(espera.index), fill_value=0)
+    tabla["Espera cuota ms"] = espera.reindex(tabla.index, fill_value=0).round(0)
+    tabla.index.name = "Logia"
+    tabla.columns.name = None
+    return tabla
@@ -0,0 +1,132 @@
+import threading
+
+import pandas as pd
+import streamlit as st
+
+from calculos import saldos_por_hermano
+from esquema import FORMATO_FECHA, tipar_hoja
+from datos import existe_hoja, crear_hoja, leer_hoja, invalidar, LoteEscritura
+
+# ==========================================
+# 1. TABLA SALDOS (UNA FILA POR H:.)
+# ==========================================
+# Resumen materializado de TESORERIA: totales de Cargo y Abono, saldo y
+# fecha del último movimiento. Cada escritura a TESORERIA actualiza las
+# filas afectadas en el MISMO lote, así que libro y resumen no se separan.
+# Si la hoja no existe, todo sigue funcionando leyendo el libro completo;
+# se crea desde "ADMIN: Mantenimiento" con la reconstrucción.
+HOJA_SALDOS = "SALDOS"
+COLS_SALDOS = ["ID_H", "Cargos", "Abonos", "Saldo", "Ultimo_Movimiento"]
+
+
+@st.cache_resource
+def _candado_saldos(id_libro):
+    # Leer-sumar-escribir en serie dentro del proceso (varias sesiones)
+    return threading.Lock()
+
+
+def leer_saldos(sh):
+    if not existe_hoja(sh, HOJA_SALDOS):
+        return None
+    df = leer_hoja(sh, HOJA_SALDOS)
+    if df.empty:
+        return tipar_hoja(HOJA_SALDOS, pd.DataFrame(columns=COLS_SALDOS))
+    return df
+
+
+def saldo_de(sh, id_h):
+    # Fila de SALDOS del H:. (dict) o None si no hay tabla materializada
+    df = leer_saldos(sh)
+    if df is None:
+        return None
+    fila = df[df['ID_H'] == int(id_h)]
+    if fila.empty:
+        return {"ID_H": int(id_h), "Cargos": 0.0, "Abonos": 0.0, "Saldo": 0.0, "Ultimo_Movimiento": pd.NaT}
+    return fila.iloc[0].to_dict()
+
+
+def _num(valor):
+    return 0.0 if pd.isna(valor) else float(valor)
+
+
+def _mas_reciente(a, b):
+    if pd.isna(a):
+        return b
+    return a if pd.isna(b) or a >= b else b
+
+
+def registrar_en_tesoreria(sh, filas, lote=None):
+    # Agrega filas [Fecha, ID_H, Concepto, Tipo, Monto] a TESORERIA y ajusta
+    # SALDOS en el mismo lote atómico (junto con lo que ya traiga `lote`).
+    lote = lote or LoteEscritura(sh)
+    with _candado_saldos(sh.id):
+        lote.anexar("TESORERIA", filas)
+        # Las filas se editan por posición: se relee la hoja (es chica) por si
+        # alguien la modificó fuera del portal.
+        invalidar(sh, HOJA_SALDOS)
+        saldos = leer_saldos(sh)
+        if saldos is not None:
+            posiciones = {int(id_h): i for i, id_h in enumerate(saldos['ID_H']) if pd.notna(id_h)}
+            nuevos = tipar_hoja("TESORERIA", pd.DataFrame(filas, columns=["Fecha", "ID_H", "Concepto", "Tipo", "Monto"]))
+            for id_h, movs in nuevos.groupby('ID_H', sort=False):
+                monto = movs['Monto'].fillna(0)
+                cargos = float(monto[movs['Tipo'] == 'Cargo'].sum())
+                abonos = float(monto[movs['Tipo'] == 'Abono'].sum())
+                fecha = movs['Fecha'].max()
+                if id_h in posiciones:
+                    previo = saldos.iloc[posiciones[id_h]]
+                    cargos += _num(previo['Cargos'])
+                    abonos += _num(previo['Abonos'])
+                    fecha = _mas_reciente(fecha, previo['Ultimo_Movimiento'])
+                    lote.actualizar(HOJA_SALDOS, posiciones[id_h] + 2, 2, [[cargos, abonos, cargos - abonos, fecha]])
+                else:
+                    lote.anexar(HOJA_SALDOS, [[int(id_h), cargos, abonos, cargos - abonos, fecha]])
+        lote.ejecutar()
+
+
+# ==========================================
+# 2. RECONSTRUCCIÓN Y VERIFICACIÓN
+# ==========================================
+def calcular_saldos(tes):
+    # SALDOS calculado desde cero a partir del libro completo
+    if tes.empty:
+        return pd.DataFrame(columns=COLS_SALDOS)
+    tabla = saldos_por_hermano(tes)
+    ultima = tes['Fecha'].groupby(tes['ID_H']).max().dt.strftime(FORMATO_FECHA).reindex(tabla.index).fillna("")
+    return pd.DataFrame({
+        'ID_H': tabla.index,
+        'Cargos': tabla['Cargo'].values,
+        'Abonos': tabla['Abono'].values,
+        'Saldo': tabla['Saldo'].values,
+        'Ultimo_Movimiento': ultima.values,
+    })
+
+
+def reconstruir_saldos(sh):
+    with _candado_saldos(sh.id):
+        invalidar(sh, "TESORERIA", HOJA_SALDOS)
+        calculado = calcular_saldos(leer_hoja(sh, "TESORERIA"))
+        lote = LoteEscritura(sh)
+        if existe_hoja(sh, HOJA_SALDOS):
+            actuales = len(leer_hoja(sh, HOJA_SALDOS))
+            if actuales:
+                lote.eliminar_filas(HOJA_SALDOS, 2, actuales + 1)
+        else:
+            crear_hoja(sh, HOJA_SALDOS, COLS_SALDOS)
+        lote.anexar(HOJA_SALDOS, calculado.values.tolist())
+        lote.ejecutar()
+    return len(calculado)
+
+
+def verificar_saldos(sh):
+    # Diferencias entre SALDOS y lo que dice el libro (vacío = consistente)
+    guardado = leer_saldos(sh)
+    if guardado is None:
+        return None
+    calculado = calcular_saldos(leer_hoja(sh, "TESORERIA"))
+    comp = calculado[['ID_H', 'Saldo']].merge(
+        guardado[['ID_H', 'Saldo']], on='ID_H', how='outer', suffixes=(' Libro', ' SALDOS')
+    )
+    comp = comp.fillna({'Saldo Libro': 0.0, 'Saldo SALDOS': 0.0})
+    comp['Diferencia'] = comp['Saldo SALDOS'] - comp['Saldo Libro']
+    return comp[comp['Diferencia'].abs() > 0.005].reset_index(drop=True)
@@ -0,0 +1,79 @@
+import random
+
+import pandas as pd
+import pytest
+
+from calculos import estado_de_cuenta
+
+
+def estado_con_ciclo(tes):
+    # El recorrido original de "Mi Tablero" (un H:.), como referencia
+    cargos = tes[tes['Tipo'] == 'Cargo']
+    dinero = tes.loc[tes['Tipo'] == 'Abono', 'Monto'].sum()
+    res = []
+    for _, r in cargos.iterrows():
+        deuda = r['Monto']
+        est = "Adeudo"
+        falta = deuda
+        if dinero >= deuda:
+            est = "Pagado"
+            falta = 0
+            dinero -= deuda
+        elif dinero > 0:
+            est = "Parcial"
+            falta = deuda - dinero
+            dinero = 0
+        res.append({"Fecha": r['Fecha'], "Concepto": r['Concepto'], "Estatus": est, "Falta": falta})
+    return pd.DataFrame(res, columns=["Fecha", "Concepto", "Estatus", "Falta"])
+
+
+def libro(movs):
+    # movs: [(ID_H, Tipo, Monto)] en el orden de la hoja
+    return pd.DataFrame({
+        'Fecha': pd.date_range("2024-01-01", periods=len(movs)),
+        'ID_H': pd.array([m[0] for m in movs], dtype="Int64"),
+        'Concepto': [f"mov {i}" for i in range(len(movs))],
+        'Tipo': pd.Categorical([m[1] for m in movs]),
+        'Monto': [float(m[2]) for m in movs],
+    })
+
+
+def libro_al_azar(rnd, hermanos=4, movimientos=12):
+    movs = []
+    for _ in range(movimientos):
+        if rnd.random() < 0.6:
+            # Cargos normales y correcciones negativas capturadas a mano
+            monto = rnd.choice([450, 450, 900, 200, 0, -300, -450])
+            movs.append((rnd.randint(1, hermanos), "Cargo", monto))
+        else:
+            movs.append((rnd.randint(1, hermanos), "Abono", rnd.choice([450, 200, 900, 100])))
+    return libro(movs)
+
+
+def comparar(tes):
+    nuevo = estado_de_cuenta(tes)
+    for id_h, del_hh in tes.groupby('ID_H'):
+        esperado = estado_con_ciclo(del_hh).reset_index(drop=True)
+        obtenido = nuevo[nuevo['ID_H'] == id_h][["Fecha", "Concepto", "Estatus", "Falta"]].reset_index(drop=True)
+        obtenido['Estatus'] = obtenido['Estatus'].astype(object)
+        pd.testing.assert_frame_equal(obtenido, esperado, check_dtype=False)
+
+
+@pytest.mark.parametrize("semilla", range(300))
+def test_igual_que_el_ciclo(semilla):
+    comparar(libro_al_azar(random.Random(semilla)))
+
+
+def test_cargo_negativo_devuelve_dinero():
+    tes = libro([(1, "Cargo", 450), (1, "Cargo", -300), (1, "Cargo", 900)])
+    estado = estado_de_cuenta(tes)
+    assert estado['Estatus'].tolist() == ["Adeudo", "Pagado", "Parcial"]
+    assert estado['Falta'].tolist() == [450, 0, 600]
+    comparar(tes)
+
+
+def test_abono_parcial_y_adeudo():
+    tes = libro([(1, "Cargo", 450), (1, "Cargo", 450), (1, "Cargo", 450), (1, "Abono", 600), (2, "Cargo", 450)])
+    estado = estado_de_cuenta(tes)
+    assert estado['Estatus'].tolist() == ["Pagado", "Parcial", "Adeudo", "Adeudo"]
+    assert estado['Falta'].tolist() == [0, 300, 450, 450]